@@ -50,11 +50,11 @@ if __name__ == '__main__':
 
     print(sark110.fw_protocol, sark110.fw_version)
     sark110.buzzer(1000, 800)
-    rs = [0]
-    xs = [0]
-    for i in range(points):
-        fr = int(fr_start + i * (fr_stop - fr_start) / (points - 1))
-        sark110.measure(fr, rs, xs)
+    res = sark110.sweep(fr_start, fr_stop, points)
+    if res is None:
+        print("Sweep failed")
+        exit(-2)
+    for fr, rs, xs in res:
         print(fr / 1e6, rs, xs)
 
     print("\nDone !")
@@ -26,28 +26,11 @@
 """
 # ---------------------------------------------------------
 from sark110 import *
-import math
+from sark110_liveplot import LivePlot, live_sweep
 import matplotlib.pyplot as plt
 from sys import argv
 
 
-def z2vswr(rs: float, xs: float, z0=50 + 0j) -> float:
-    gamma = math.sqrt((rs - z0.real) ** 2 + xs ** 2) / math.sqrt((rs + z0.real) ** 2 + xs ** 2)
-    if gamma > 0.980197824:
-        return 99.999
-    swr = (1 + gamma) / (1 - gamma)
-    return swr
-
-
-def z2mag(r: float, x: float) -> float:
-    return math.sqrt(r ** 2 + x ** 2)
-
-
-def z2gamma(rs: float, xs: float, z0=50 + 0j) -> complex:
-    z = complex(rs, xs)
-    return (z - z0) / (z + z0)
-
-
 if __name__ == '__main__':
     if len(argv) != 4:
         print("please provide arguments: start (Hz) stop (Hz) points")
@@ -71,21 +54,13 @@ if __name__ == '__main__':
     device.buzzer(1000, 800)
 
     plt.style.use('seaborn-whitegrid')
-    y = []
-    x = []
-    rs = [0]
-    xs = [0]
-    for i in range(points):
-        fr = int(fr_start + i * (fr_stop - fr_start) / (points - 1))
-        device.measure(fr, rs, xs)
-        x.append(fr / 1e6)
-        y.append(z2vswr(rs[0][0], xs[0][0]))
-
-    plt.plot(x, y)
-    plt.title('SARK-110 Test')
-    plt.xlabel('Freq MHz')
-    plt.ylabel('SWR')
-    plt.ylim(1., 10.)
+    # Points are drawn as they are measured
+    plot = LivePlot(fr_start, fr_stop, points, title='SARK-110 Test')
+    plot.show()
+    res = live_sweep(device, fr_start, fr_stop, points, plot=plot)
+    if res is None:
+        print("Sweep failed")
+        exit(-3)
     plt.show()
 
     print("\nDone !")
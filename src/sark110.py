@@ -25,26 +25,792 @@
   SOFTWARE.
 """
 # ---------------------------------------------------------
+import glob
+import math
 import os
+import queue
+import select
 import struct
 import time
+from array import array
+from collections import OrderedDict
 
-if os.name == 'nt':
-    import pywinusb.hid as hid
-    import threading
-elif os.name == 'posix':
-    import hid
-else:
-    raise ImportError("Error: no implementation for your platform ('{}') available".format(os.name))
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# HID library of the platform (pywinusb on Windows, hidapi elsewhere); imported on first use by the
+# transports, so the rest of the module works without it
+hid = None
 
 SARK110_VENDOR_ID = 0x0483
 SARK110_PRODUCT_ID = 0x5750
 
 WAIT_HID_DATA_MS = 1000
 
+# Commands: report id, command id and arguments, little endian, zero padded to the frame size
+CMD_FRAME_SIZE = 19
+CMD_VERSION = 1
+CMD_MEASURE = 2
+CMD_MEASURE_EXT = 12
+CMD_BUZZER = 20
+CMD_RESET = 50
+_CMD_VERSION = struct.Struct('<BB17x')
+_CMD_MEASURE = struct.Struct('<BBIBB11x')         # freq, cal, samples
+_CMD_MEASURE_EXT = struct.Struct('<BBIBBI7x')     # freq, cal, samples, step
+_CMD_BUZZER = struct.Struct('<BBHH13x')           # freq, duration
+_CMD_RESET = _CMD_VERSION
+# measure response: status byte, rs and xs as float32
+_MEASURE_REPLY = struct.Struct('<Bff')
+
+# measure_ext response: status byte, four (rs, xs) pairs as half floats, one pad byte
+EXT_FRAME_SIZE = 18
+_EXT_REPLY = struct.Struct('<B8e')
+if np is not None:
+    _EXT_DTYPE = np.dtype([('status', 'u1'), ('z', '<f2', (4, 2)), ('pad', 'u1')])
+
+
+# ---------------------------------------------------------
+def _load_hid():
+    """
+    Imports the HID library of the platform
+    :return: the module
+    """
+    global hid
+    if hid is None:
+        if os.name == 'nt':
+            import pywinusb.hid as lib
+        elif os.name == 'posix':
+            import hid as lib
+        else:
+            raise ImportError("Error: no implementation for your platform ('{}') available".format(os.name))
+        hid = lib
+    return hid
+
+
+def encode_sweep(freqs, step=None, cal=True, samples=1, out=None) -> memoryview:
+    """
+    Encodes the command frames of a whole sweep in one buffer
+    :param freqs:   frequency of each command in hertz; for measure_ext, the first of its four points
+    :param step:    step in hertz to encode measure_ext commands; None to encode measure commands
+    :param cal:     True to get OSL calibrated data; False to get uncalibrated data
+    :param samples: number of samples for averaging
+    :param out:     writable buffer of at least len(freqs) * 19 bytes to reuse; None to allocate one
+    :return: memoryview of the frames, 19 bytes each
+    """
+    n = len(freqs)
+    if out is None:
+        out = bytearray(n * CMD_FRAME_SIZE)
+    buf = memoryview(out).cast('B')[:n * CMD_FRAME_SIZE]
+    cal = 1 if cal else 0
+    if step is None:
+        pack_into = _CMD_MEASURE.pack_into
+        for k in range(n):
+            pack_into(buf, k * CMD_FRAME_SIZE, 0, CMD_MEASURE, freqs[k], cal, samples)
+    else:
+        pack_into = _CMD_MEASURE_EXT.pack_into
+        for k in range(n):
+            pack_into(buf, k * CMD_FRAME_SIZE, 0, CMD_MEASURE_EXT, freqs[k], cal, samples, step)
+    return buf
+
+
+def decode_ext(frames):
+    """
+    Decodes measure_ext responses in batch, through a single float16 view of the raw data
+    :param frames:  raw 18 byte response frames; one bytes-like object with the frames concatenated
+                    or a sequence of frames
+    :return: (rs, xs, status) numpy arrays; rs and xs are float32, four points per frame
+    """
+    if np is None:
+        raise ImportError("Error: decode_ext requires numpy")
+    if not isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = b''.join(bytes(fr[:EXT_FRAME_SIZE]).ljust(EXT_FRAME_SIZE, b'\0') for fr in frames)
+    recs = np.frombuffer(frames, dtype=_EXT_DTYPE, count=len(frames) // EXT_FRAME_SIZE)
+    z = recs['z'].astype(np.float32)
+    return z[:, :, 0].ravel(), z[:, :, 1].ravel(), recs['status']
+
+
+def decode_ext_frame(rcv):
+    """
+    Decodes one measure_ext response
+    Gives the same values as decode_ext, except for NaN payloads, which are not kept
+    :param rcv: response frame
+    :return: (status, rs0, xs0, rs1, xs1, rs2, xs2, rs3, xs3)
+    """
+    return _EXT_REPLY.unpack_from(bytes(rcv[:EXT_FRAME_SIZE]))
+
+
+def _half2float(float16):
+    """
+    Half float bits to float, through float32
+    :param float16:
+    :return:
+    """
+    s = int((float16 >> 15) & 0x00000001)  # sign
+    e = int((float16 >> 10) & 0x0000001f)  # exponent
+    f = int(float16 & 0x000003ff)  # fraction
+
+    if e == 0:
+        if f == 0:
+            return struct.unpack('f', struct.pack('I', s << 31))[0]
+        else:
+            while not (f & 0x00000400):
+                f = f << 1
+                e -= 1
+            e += 1
+            f &= ~0x00000400
+    elif e == 31:
+        if f == 0:
+            return struct.unpack('f', struct.pack('I', (s << 31) | 0x7f800000))[0]
+        else:
+            return struct.unpack('f', struct.pack('I', (s << 31) | 0x7f800000 | (f << 13)))[0]
+
+    e = e + (127 - 15)
+    f = f << 13
+    return struct.unpack('f', struct.pack('I', (s << 31) | (e << 23) | f))[0]
+
+
+# ---------------------------------------------------------
+# array typecode for uint32 values
+_U32 = 'I' if array('I').itemsize == 4 else 'L'
+
+
+class SweepResult:
+    """
+    Sweep data held in contiguous arrays: frequencies as uint32 (Hz), rs and xs as float32 (ohms)
+    freq, rs and xs are memoryviews, so numpy.asarray() takes them without copying.
+    ok flags each point: 1 measured, 0 failed (rs and xs are NaN then).
+    Slicing returns a SweepResult sharing the same storage.
+    """
+    __slots__ = ('_freq', '_rs', '_xs', '_ok')
+
+    def __init__(self, freq, rs, xs, ok=None):
+        """
+        :param freq:    uint32 buffer (e.g. array('I') or numpy uint32 array)
+        :param rs:      float32 buffer, real part of the impedance
+        :param xs:      float32 buffer, imag part of the impedance
+        :param ok:      uint8 buffer of point flags; None for all points valid
+        """
+        if ok is None:
+            ok = array('B', b'\x01' * len(freq))
+        self._freq = memoryview(freq)
+        self._rs = memoryview(rs)
+        self._xs = memoryview(xs)
+        self._ok = memoryview(ok)
+        if self._freq.itemsize != 4 or self._rs.itemsize != 4 or self._xs.itemsize != 4 or self._ok.itemsize != 1:
+            raise ValueError("SweepResult needs uint32 frequencies, float32 values and uint8 flags")
+        if not len(self._freq) == len(self._rs) == len(self._xs) == len(self._ok):
+            raise ValueError("SweepResult arrays differ in length")
+
+    @classmethod
+    def alloc(cls, points: int):
+        """
+        Allocates a zeroed result
+        :param points:  number of points
+        :return: SweepResult
+        """
+        return cls(array(_U32, bytes(4 * points)), array('f', bytes(4 * points)), array('f', bytes(4 * points)),
+                   array('B', b'\x01' * points))
+
+    @property
+    def freq(self) -> memoryview:
+        return self._freq
+
+    @property
+    def rs(self) -> memoryview:
+        return self._rs
+
+    @property
+    def xs(self) -> memoryview:
+        return self._xs
+
+    @property
+    def ok(self) -> memoryview:
+        return self._ok
+
+    @property
+    def failed(self) -> int:
+        """
+        Number of points that could not be measured
+        """
+        return self._ok.tobytes().count(0)
+
+    @property
+    def z(self):
+        """
+        Complex impedance
+        :return: complex64 numpy array (new)
+        """
+        if np is None:
+            raise ImportError("Error: SweepResult.z requires numpy")
+        z = np.empty(len(self._rs), dtype=np.complex64)
+        z.real = self._rs
+        z.imag = self._xs
+        return z
+
+    @property
+    def nbytes(self) -> int:
+        return self._freq.nbytes + self._rs.nbytes + self._xs.nbytes + self._ok.nbytes
+
+    def to_numpy(self):
+        """
+        Views of the data as numpy arrays, without copying
+        :return: (freq, rs, xs)
+        """
+        if np is None:
+            raise ImportError("Error: SweepResult.to_numpy requires numpy")
+        return np.asarray(self._freq), np.asarray(self._rs), np.asarray(self._xs)
+
+    def __len__(self):
+        return len(self._freq)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return SweepResult(self._freq[key], self._rs[key], self._xs[key], self._ok[key])
+        return self._freq[key], self._rs[key], self._xs[key]
+
+    def __iter__(self):
+        return zip(self._freq, self._rs, self._xs)
+
+    def __repr__(self):
+        if len(self):
+            return "SweepResult({} points, {} to {} Hz)".format(len(self), self._freq[0], self._freq[-1])
+        return "SweepResult(0 points)"
+
+
+# ---------------------------------------------------------
+class Sark110Transport:
+    """
+    Exchanges HID reports with the device; base class of the backends Sark110 can use.
+    Commands are 19 bytes (report id + 18 bytes); replies are 18 bytes.
+    """
+    path = None
+
+    @staticmethod
+    def find_devices() -> list:
+        """
+        Lists the connected SARK-110 devices this backend can open
+        :return: list of dicts with "path" and "serial"
+        """
+        return []
+
+    def open(self) -> int:
+        """
+        Opens the device
+        :return: <0 err; >0 ok
+        """
+        return -1
+
+    def close(self):
+        """
+        Closes the device
+        :return:
+        """
+        pass
+
+    def write(self, snd):
+        """
+        Sends one command; raises IOError on failure
+        :param snd: command, 19 bytes
+        :return:
+        """
+        raise NotImplementedError
+
+    def read(self, timeout_ms: int):
+        """
+        Waits for one reply; raises IOError on failure
+        :param timeout_ms:  timeout in ms
+        :return: reply; empty on timeout
+        """
+        raise NotImplementedError
+
+    def fileno(self) -> int:
+        """
+        File descriptor for select/poll, when the backend has one
+        :return: fd; -1 if not available
+        """
+        return -1
+
+    def drain(self, timeout_ms=0) -> int:
+        """
+        Discards stale replies, e.g. one arriving after its command timed out
+        :param timeout_ms:  time to wait for each stale reply
+        :return: number of replies discarded
+        """
+        n = 0
+        while n < 16 and self.read(timeout_ms):
+            n += 1
+        return n
+
+
+class HidapiTransport(Sark110Transport):
+    """
+    cython-hidapi backend (Linux, macOS)
+    """
+
+    def __init__(self, path=None, serial=None):
+        """
+        :param path:    hidapi device path, as given by find_devices(); None for any
+        :param serial:  serial number; None for any
+        """
+        self.path = path
+        self._serial = serial
+        self._dev = None
+
+    @staticmethod
+    def find_devices() -> list:
+        try:
+            lib = _load_hid()
+        except ImportError:
+            return []
+        return [{"path": d["path"], "serial": d.get("serial_number") or ""}
+                for d in lib.enumerate(SARK110_VENDOR_ID, SARK110_PRODUCT_ID)]
+
+    def open(self) -> int:
+        try:
+            self._dev = _load_hid().device()
+        except ImportError:
+            # hidapi not installed
+            return -1
+        try:
+            if self.path is not None:
+                self._dev.open_path(self.path)
+            else:
+                self._dev.open(SARK110_VENDOR_ID, SARK110_PRODUCT_ID, self._serial)
+            self._dev.set_nonblocking(0)
+            return 1
+        except IOError:
+            self._dev = None
+            return -1
+
+    def close(self):
+        if self._dev:
+            self._dev.close()
+        self._dev = None
+
+    def write(self, snd):
+        self._dev.write(snd)
+
+    def read(self, timeout_ms: int):
+        if timeout_ms <= 0:
+            # hidapi takes a zero timeout as no timeout: poll in non-blocking mode instead
+            self._dev.set_nonblocking(1)
+            try:
+                return self._dev.read(18)
+            finally:
+                self._dev.set_nonblocking(0)
+        return self._dev.read(18, timeout_ms)
+
+    def drain(self, timeout_ms=0) -> int:
+        if timeout_ms > 0:
+            return super().drain(timeout_ms)
+        # one switch to non-blocking mode for the whole flush
+        self._dev.set_nonblocking(1)
+        try:
+            n = 0
+            while n < 16 and self._dev.read(18):
+                n += 1
+            return n
+        finally:
+            self._dev.set_nonblocking(0)
+
+
+class PywinusbTransport(Sark110Transport):
+    """
+    pywinusb backend (Windows); replies arrive through a callback from the pywinusb reader thread,
+    which queues them until read
+    """
+
+    def __init__(self, path=None, serial=None):
+        """
+        :param path:    device path, as given by find_devices(); None for any
+        :param serial:  serial number; None for any
+        """
+        self.path = path
+        self._serial = serial
+        self._dev = None
+        self._report = None
+        self._replies = queue.SimpleQueue()
+
+    @staticmethod
+    def find_devices() -> list:
+        try:
+            lib = _load_hid()
+        except ImportError:
+            return []
+        hid_filter = lib.HidDeviceFilter(vendor_id=SARK110_VENDOR_ID, product_id=SARK110_PRODUCT_ID)
+        return [{"path": d.device_path, "serial": d.serial_number or ""} for d in hid_filter.get_devices()]
+
+    def open(self) -> int:
+        try:
+            lib = _load_hid()
+        except ImportError:
+            # pywinusb not installed
+            return -1
+        hid_filter = lib.HidDeviceFilter(vendor_id=SARK110_VENDOR_ID, product_id=SARK110_PRODUCT_ID)
+        try:
+            devices = [d for d in hid_filter.get_devices()
+                       if (self.path is None or d.device_path == self.path) and
+                       (self._serial is None or d.serial_number == self._serial)]
+            if not devices:
+                return -1
+            self._dev = devices[0]
+            self._replies = queue.SimpleQueue()
+            self._dev.open()
+            self._dev.set_raw_data_handler(self._rx_handler)
+            self._report = self._dev.find_output_reports()[0]
+            return 1
+        except:
+            self._dev = None
+            return -2
+
+    def close(self):
+        if self._dev:
+            self._dev.close()
+        self._dev = None
+        self._report = None
+
+    def write(self, snd):
+        self._report.set_raw_data(list(snd))
+        self._report.send()
+
+    def read(self, timeout_ms: int):
+        try:
+            rcv = self._replies.get(True, timeout_ms / 1000)
+        except queue.Empty:
+            return []
+        return rcv[1:]
+
+    def _rx_handler(self, data):
+        """
+        Handler called when a report is received
+        :param data:
+        :return:
+        """
+        self._replies.put(data.copy())
+
+
+class HidrawTransport(Sark110Transport):
+    """
+    Linux /dev/hidrawN backend using plain os.read/os.write, without hidapi
+    The reply is read into a buffer reused on every call: the value returned by read() is
+    only valid until the next read. fileno() can be used with select/poll.
+    """
+
+    def __init__(self, path=None, serial=None):
+        """
+        :param path:    hidraw device node, e.g. "/dev/hidraw2"; None to find the first SARK-110
+        :param serial:  serial number, used when path is None; None for any
+        """
+        self.path = path
+        self._serial = serial
+        self._fd = -1
+        self._buf = bytearray(64)
+        self._view = memoryview(self._buf)
+        self._poll = None
+
+    @staticmethod
+    def find_devices() -> list:
+        """
+        Lists the hidraw nodes of the connected SARK-110 devices
+        :return: list of dicts with "path" and "serial"
+        """
+        hid_id = "HID_ID=0003:{:08X}:{:08X}".format(SARK110_VENDOR_ID, SARK110_PRODUCT_ID)
+        devices = []
+        for uevent in sorted(glob.glob("/sys/class/hidraw/hidraw*/device/uevent")):
+            try:
+                with open(uevent) as f:
+                    lines = f.read().splitlines()
+            except IOError:
+                continue
+            if hid_id not in (line.upper() for line in lines):
+                continue
+            serial = ""
+            for line in lines:
+                if line.startswith("HID_UNIQ="):
+                    serial = line[9:]
+            devices.append({"path": "/dev/" + uevent.split(os.sep)[4], "serial": serial})
+        return devices
+
+    def open(self) -> int:
+        path = self.path
+        if path is None:
+            devices = [d for d in self.find_devices() if self._serial is None or d["serial"] == self._serial]
+            if not devices:
+                return -1
+            path = devices[0]["path"]
+        try:
+            self._fd = os.open(path, os.O_RDWR)
+        except OSError:
+            return -2
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+        return 1
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+        self._fd = -1
+        self._poll = None
+
+    def write(self, snd):
+        if not isinstance(snd, (bytes, bytearray, memoryview)):
+            snd = bytes(snd)
+        os.write(self._fd, snd)
+
+    def read(self, timeout_ms: int):
+        if not self._poll.poll(timeout_ms):
+            return b''
+        n = os.readv(self._fd, (self._buf,))
+        return self._view[:n]
+
+    def fileno(self) -> int:
+        return self._fd
+
+
+# ---------------------------------------------------------
+class CommandStats:
+    """
+    Counters of one command id
+    """
+    __slots__ = ('count', 'ok', 'timeouts', 'short_reads', 'errors', 'retries', 'bytes_out', 'bytes_in',
+                 'rtt_total', 'rtt_min', 'rtt_max', 'rtt_last')
+
+    def __init__(self):
+        self.count = 0
+        self.ok = 0
+        self.timeouts = 0
+        self.short_reads = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.rtt_total = 0.
+        self.rtt_min = 0.
+        self.rtt_max = 0.
+        self.rtt_last = 0.
+
+    def as_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d['rtt_mean'] = self.rtt_total / self.count if self.count else 0.
+        return d
+
+
+class Sark110Stats:
+    """
+    Instrumentation of the command exchanges: round trip time (s), timeouts, short reads, I/O errors,
+    retries and bytes, by command id (1 version, 2 measure, 12 measure_ext, 20 buzzer, 50 reset).
+    Hooks are called after every exchange as hook(cmd, rtt, result), result being one of
+    "ok", "timeout", "short", "error" or "retry".
+    """
+    RESULTS = ("ok", "timeout", "short", "error", "retry")
+
+    def __init__(self):
+        self.commands = {}
+        self.hooks = []
+
+    def record(self, cmd: int, rtt: float, result: str, bytes_out=0, bytes_in=0):
+        st = self.commands.get(cmd)
+        if st is None:
+            st = self.commands[cmd] = CommandStats()
+        if result == "retry":
+            st.retries += 1
+        else:
+            st.count += 1
+            if result == "ok":
+                st.ok += 1
+            elif result == "timeout":
+                st.timeouts += 1
+            elif result == "short":
+                st.short_reads += 1
+            else:
+                st.errors += 1
+            st.bytes_out += bytes_out
+            st.bytes_in += bytes_in
+            st.rtt_total += rtt
+            st.rtt_last = rtt
+            if st.count == 1 or rtt < st.rtt_min:
+                st.rtt_min = rtt
+            if rtt > st.rtt_max:
+                st.rtt_max = rtt
+        for hook in self.hooks:
+            hook(cmd, rtt, result)
+
+    def snapshot(self) -> dict:
+        """
+        :return: {cmd: counters dict}, a copy
+        """
+        return {cmd: st.as_dict() for cmd, st in self.commands.items()}
+
+    def clear(self):
+        self.commands = {}
+
+
+class RetryPolicy:
+    """
+    Read deadline and retries of the command exchanges.
+    The deadline is learned from the round trips of each (command, samples) pair, as TCP does:
+    srtt + 4 * rttvar, clamped to [min_timeout_ms, max_timeout_ms]; it is max_timeout_ms until
+    the first reply. A failed exchange is retried up to retries times, after draining stale replies,
+    doubling the deadline each time. Pending replies are also flushed before every command, and after
+    an exchange that needed retries the late replies of its failed attempts are waited for.
+    """
+
+    def __init__(self, retries=2, min_timeout_ms=50, max_timeout_ms=WAIT_HID_DATA_MS, drain_ms=5, adaptive=True):
+        """
+        :param retries:         retries after the first attempt
+        :param min_timeout_ms:  lower bound of the learned deadline
+        :param max_timeout_ms:  upper bound of the deadline, and deadline before learning
+        :param drain_ms:        wait for each stale reply before a retry; 0 to flush only those already queued
+        :param adaptive:        False to always wait max_timeout_ms
+        """
+        self.retries = retries
+        self.min_timeout_ms = min_timeout_ms
+        self.max_timeout_ms = max_timeout_ms
+        self.drain_ms = drain_ms
+        self.adaptive = adaptive
+        self._rtt = {}
+
+    def timeout_ms(self, key) -> int:
+        """
+        :param key: key of the exchange: (command id, samples), or (command id, freq, duration) for the buzzer
+        :return: read deadline in ms
+        """
+        est = self._rtt.get(key)
+        if est is None or not self.adaptive:
+            return self.max_timeout_ms
+        t = int(math.ceil(1000 * (est[0] + 4 * est[1])))
+        return min(self.max_timeout_ms, max(self.min_timeout_ms, t))
+
+    def backoff(self, timeout_ms: int) -> int:
+        """
+        :param timeout_ms:  deadline of the failed attempt
+        :return: deadline of the retry
+        """
+        return min(self.max_timeout_ms, 2 * timeout_ms)
+
+    def update(self, key, rtt: float):
+        """
+        Learns from a successful exchange
+        :param key: key of the exchange: (command id, samples), or (command id, freq, duration) for the buzzer
+        :param rtt: round trip time in seconds
+        """
+        est = self._rtt.get(key)
+        if est is None:
+            self._rtt[key] = [rtt, rtt / 2]
+        else:
+            est[1] += (abs(est[0] - rtt) - est[1]) / 4
+            est[0] += (rtt - est[0]) / 8
+
+    def clear(self):
+        """
+        Forgets the learned round trips, e.g. after reconnecting
+        """
+        self._rtt = {}
+
+
+class MeasurementCache:
+    """
+    Cache of measurements keyed by (freq, cal, samples), with time to live and LRU eviction within
+    a memory budget. Values from measure (float32) also serve measure_ext; values from measure_ext
+    (half float) only serve measure_ext.
+    """
+    # Approximate memory taken by one entry: key and value tuples, floats and the dict node
+    ENTRY_BYTES = 280
+
+    def __init__(self, ttl=60., max_bytes=16 << 20):
+        """
+        :param ttl:         seconds an entry stays valid; None for no expiry
+        :param max_bytes:   memory budget
+        """
+        self.ttl = ttl
+        self.max_entries = max(1, max_bytes // self.ENTRY_BYTES)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._entries) * self.ENTRY_BYTES
+
+    def get(self, freq: int, cal: bool, samples: int, full=False):
+        """
+        :param full:    True to accept only float32 (measure) values
+        :return: (rs, xs); None if missing or expired
+        """
+        key = (freq, bool(cal), samples)
+        e = self._entries.get(key)
+        if e is not None and self.ttl is not None and time.monotonic() - e[3] > self.ttl:
+            del self._entries[key]
+            e = None
+        if e is None or (full and not e[2]):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return e[0], e[1]
+
+    def put(self, freq: int, cal: bool, samples: int, rs: float, xs: float, full=False):
+        """
+        :param full:    True for float32 (measure) values
+        """
+        key = (freq, bool(cal), samples)
+        e = self._entries.get(key)
+        if e is not None and e[2] and not full and (self.ttl is None or time.monotonic() - e[3] <= self.ttl):
+            # keep the more precise value
+            return
+        self._entries[key] = (rs, xs, full, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, fmin=None, fmax=None):
+        """
+        Drops entries, all of them or those within a frequency range
+        :param fmin:    lowest frequency to drop; None for all
+        :param fmax:    highest frequency to drop; None for all
+        """
+        if fmin is None and fmax is None:
+            self._entries.clear()
+            return
+        lo = fmin if fmin is not None else 0
+        hi = fmax if fmax is not None else float('inf')
+        for key in [k for k in self._entries if lo <= k[0] <= hi]:
+            del self._entries[key]
+
+
+def default_transport(path=None, serial=None) -> Sark110Transport:
+    """
+    Transport used when none is given: pywinusb on Windows, hidapi elsewhere
+    :param path:    device path, as given by find_devices(); None for any
+    :param serial:  serial number; None for any
+    :return:
+    """
+    if os.name == 'nt':
+        return PywinusbTransport(path, serial)
+    return HidapiTransport(path, serial)
+
+
+def find_devices() -> list:
+    """
+    Lists the connected SARK-110 devices, as seen by the default transport
+    :return: list of dicts with "path" and "serial"
+    """
+    if os.name == 'nt':
+        return PywinusbTransport.find_devices()
+    return HidapiTransport.find_devices()
+
 
 class Sark110:
-    _handler = 0
+    _handler = None
+    _transport = None
+    _stats = None
+    _policy = None
+    _cache = None
     _is_connect = 0
     _max_freq = 0
     _min_freq = 0
@@ -76,40 +842,96 @@ class Sark110:
     def is_connected(self) -> bool:
         return self._is_connect
 
-    def __init__(self):
-        self._handler = 0
+    @property
+    def transport(self) -> Sark110Transport:
+        return self._transport
+
+    @property
+    def policy(self) -> RetryPolicy:
+        return self._policy
+
+    @property
+    def cache(self) -> MeasurementCache:
+        """
+        Measurement cache; None when disabled
+        """
+        return self._cache
+
+    @property
+    def stats(self) -> Sark110Stats:
+        """
+        Instrumentation of the command exchanges; None when disabled
+        """
+        return self._stats
+
+    def __init__(self, transport=None, policy=None):
+        """
+        :param transport:   Sark110Transport backend; None for the platform default
+        :param policy:      RetryPolicy; None for the default one
+        """
+        if transport is None:
+            transport = default_transport()
+        if policy is None:
+            policy = RetryPolicy()
+        self._transport = transport
+        self._policy = policy
+        self._handler = None
         self._is_connect = 0
+        self._stats = None
+        self._cache = None
+        # transmit buffer, reused by every command
+        self._snd = bytearray(CMD_FRAME_SIZE)
+
+    def enable_stats(self, hook=None) -> Sark110Stats:
+        """
+        Starts recording the command exchanges
+        :param hook:    optional callable hook(cmd, rtt, result) called after every exchange
+        :return: the stats object
+        """
+        if self._stats is None:
+            self._stats = Sark110Stats()
+        if hook is not None:
+            self._stats.hooks.append(hook)
+        return self._stats
+
+    def disable_stats(self):
+        """
+        Stops recording the command exchanges
+        :return:
+        """
+        self._stats = None
+
+    def enable_cache(self, cache=None) -> MeasurementCache:
+        """
+        Serves measure and measure_ext from a cache of recent measurements, so sweeps overlapping
+        earlier ones only measure the missing frequencies. The cache is cleared on open, close and reset.
+        :param cache:   MeasurementCache; None for a default one
+        :return: the cache
+        """
+        if cache is None:
+            cache = MeasurementCache()
+        self._cache = cache
+        return cache
+
+    def disable_cache(self):
+        """
+        Stops caching measurements
+        :return:
+        """
+        self._cache = None
 
     def open(self) -> int:
         """
         Opens the device
         :return: <0 err; >0 ok
         """
-        # Windows: pywinusb
-        if os.name == 'nt':
-            target_vendor_id = SARK110_VENDOR_ID
-            target_product_id = SARK110_PRODUCT_ID
-            hid_filter = hid.HidDeviceFilter(vendor_id=target_vendor_id, product_id=target_product_id)
-            try:
-                self._handler = hid_filter.get_devices()[0]
-                if not self._handler:
-                    return -1
-                else:
-                    self._handler.open()
-                    self._handler.set_raw_data_handler(self._rx_handler)
-                    return 1
-            except:
-                return -2
-
-        # Linux: hidapi
-        else:
-            self._handler = hid.device()
-            try:
-                self._handler.open(SARK110_VENDOR_ID, SARK110_PRODUCT_ID)
-                self._handler.set_nonblocking(0)
-                return 1
-            except IOError as ex:
-                return -1
+        rc = self._transport.open()
+        if rc > 0:
+            self._handler = self._transport
+            self._policy.clear()
+            if self._cache is not None:
+                self._cache.invalidate()
+        return rc
 
     def connect(self) -> int:
         """
@@ -130,8 +952,10 @@ class Sark110:
         """
         if self._handler:
             self._handler.close()
-        self._handler = 0
+        self._handler = None
         self._is_connect = 0
+        if self._cache is not None:
+            self._cache.invalidate()
 
     def measure(self, freq: int, rs: float, xs: float, cal=True, samples=1) -> int:
         """
@@ -145,32 +969,29 @@ class Sark110:
         """
         if not self._is_connect:
             return -1
-        snd = [0x0] * 19
-        snd[1] = 2
-        b = self._int2bytes(freq)
-        snd[2] = b[0]
-        snd[3] = b[1]
-        snd[4] = b[2]
-        snd[5] = b[3]
-        if cal:
-            snd[6] = 1
-        else:
-            snd[6] = 0
-        snd[7] = samples
+        try:
+            _CMD_MEASURE.pack_into(self._snd, 0, 0, CMD_MEASURE, freq, 1 if cal else 0, samples)
+        except struct.error:
+            # freq or samples out of the range of the command
+            return -2
+        return self._measure(self._snd, freq, rs, xs, cal, samples)
+
+    def _measure(self, snd, freq, rs, xs, cal, samples):
+        cache = self._cache
+        if cache is not None and freq:
+            v = cache.get(freq, cal, samples, True)
+            if v is not None:
+                rs[0] = (v[0],)
+                xs[0] = (v[1],)
+                return 1
         rcv = self._send_rcv(snd)
         if rcv[0] != 79:
             return -2
-        b = bytearray([0, 0, 0, 0])
-        b[0] = rcv[1]
-        b[1] = rcv[2]
-        b[2] = rcv[3]
-        b[3] = rcv[4]
-        rs[0] = struct.unpack('f', b)
-        b[0] = rcv[5]
-        b[1] = rcv[6]
-        b[2] = rcv[7]
-        b[3] = rcv[8]
-        xs[0] = struct.unpack('f', b)
+        _, r, x = _MEASURE_REPLY.unpack_from(bytes(rcv[:_MEASURE_REPLY.size]))
+        rs[0] = (r,)
+        xs[0] = (x,)
+        if cache is not None and freq:
+            cache.put(freq, cal, samples, r, x, True)
         return 1
 
     def buzzer(self, freq=0, duration=0) -> int:
@@ -183,15 +1004,11 @@ class Sark110:
         """
         if not self._is_connect:
             return -1
-        snd = [0x0] * 19
-        snd[1] = 20
-        b = self._short2bytes(freq)
-        snd[2] = b[0]
-        snd[3] = b[1]
-        b = self._short2bytes(duration)
-        snd[4] = b[0]
-        snd[5] = b[1]
-        rcv = self._send_rcv(snd)
+        freq &= 0xFFFF
+        duration &= 0xFFFF
+        _CMD_BUZZER.pack_into(self._snd, 0, 0, CMD_BUZZER, freq, duration)
+        # Sent once, as a retry beeps again; the deadline is learned per tone
+        rcv = self._send_rcv(self._snd, 0, (CMD_BUZZER, freq, duration))
         if duration == 0:
             time.sleep(.2)
         else:
@@ -207,10 +1024,12 @@ class Sark110:
         """
         if not self._is_connect:
             return -1
-        snd = [0x0] * 19
-        snd[1] = 50
-        rcv = self._send_rcv(snd)
-        if rcv == 79:
+        _CMD_RESET.pack_into(self._snd, 0, 0, CMD_RESET)
+        # Sent once: the device may be rebooting instead of replying
+        rcv = self._send_rcv(self._snd, 0)
+        if self._cache is not None:
+            self._cache.invalidate()
+        if rcv[0] == 79:
             return 1
         return -2
 
@@ -229,38 +1048,146 @@ class Sark110:
         """
         if not self._is_connect:
             return -1
-        snd = [0x0] * 19
-        snd[1] = 12
-        b = self._int2bytes(freq)
-        snd[2] = b[0]
-        snd[3] = b[1]
-        snd[4] = b[2]
-        snd[5] = b[3]
-        b = self._int2bytes(step)
-        snd[8] = b[0]
-        snd[9] = b[1]
-        snd[10] = b[2]
-        snd[11] = b[3]
-        if cal:
-            snd[6] = 1
-        else:
-            snd[6] = 0
-        snd[7] = samples
+        try:
+            _CMD_MEASURE_EXT.pack_into(self._snd, 0, 0, CMD_MEASURE_EXT, freq, 1 if cal else 0, samples, step)
+        except struct.error:
+            # freq, step or samples out of the range of the command
+            return -2
+        return self._measure_ext(self._snd, freq, step, rs, xs, cal, samples)
+
+    def _measure_ext(self, snd, freq, step, rs, xs, cal, samples):
+        cache = self._cache
+        if cache is not None and freq:
+            vals = [cache.get(freq + k * step, cal, samples) for k in range(4)]
+            if None not in vals:
+                for k in range(4):
+                    rs[k], xs[k] = vals[k]
+                return 1
         rcv = self._send_rcv(snd)
         if rcv[0] != 79:
             return -2
 
-        rs[0] = self._half2float(rcv[1], rcv[2])
-        xs[0] = self._half2float(rcv[3], rcv[4])
-        rs[1] = self._half2float(rcv[5], rcv[6])
-        xs[1] = self._half2float(rcv[7], rcv[8])
-        rs[2] = self._half2float(rcv[9], rcv[10])
-        xs[2] = self._half2float(rcv[11], rcv[12])
-        rs[3] = self._half2float(rcv[13], rcv[14])
-        xs[3] = self._half2float(rcv[15], rcv[16])
+        _, rs[0], xs[0], rs[1], xs[1], rs[2], xs[2], rs[3], xs[3] = decode_ext_frame(rcv)
+        if cache is not None and freq:
+            for k in range(4):
+                cache.put(freq + k * step, cal, samples, rs[k], xs[k])
 
         return 1
 
+    def sweep(self, start: int, stop: int, points: int, cal=True, samples=1, precision="half", out=None):
+        """
+        Takes a linear sweep between start and stop
+        Points are spaced by an integer step, rounded down: freq[i] = start + i * step, so the last one may be
+        slightly below stop
+        With precision "half" the sweep is taken four points per command using measure_ext;
+        with precision "full" it is taken one point per command using measure (float32 values)
+        :param start:     start frequency in hertz
+        :param stop:      stop frequency in hertz; not below start
+        :param points:    number of points
+        :param cal:       True to get OSL calibrated data; False to get uncalibrated data
+        :param samples:   number of samples for averaging
+        :param precision: "half" or "full"
+        :param out:       SweepResult of points length to fill; None to allocate one
+        :return: SweepResult, with the points that failed after retries flagged in ok; None on error
+        """
+        res = self._sweep_init(start, stop, points, samples, precision, out)
+        if res is None:
+            return None
+        for _ in self._sweep_run(res, cal, samples, precision):
+            pass
+        return res
+
+    def iter_sweep(self, start: int, stop: int, points: int, cal=True, samples=1, precision="half", chunk_points=4,
+                   out=None):
+        """
+        Takes a linear sweep like sweep(), yielding the points as they are measured
+        :param chunk_points: minimum number of points per chunk (the last one may be shorter)
+        :param out:          SweepResult of points length to fill; None to allocate one
+        :return: generator of SweepResult chunks, in frequency order; they are views of the whole result
+        """
+        res = self._sweep_init(start, stop, points, samples, precision, out)
+        if res is None:
+            return
+        lo = 0
+        for hi in self._sweep_run(res, cal, samples, precision):
+            if hi - lo >= chunk_points or hi == points:
+                yield res[lo:hi]
+                lo = hi
+
+    def _sweep_init(self, start, stop, points, samples, precision, out):
+        if not self._is_connect or points < 1 or stop < start or precision not in ("half", "full"):
+            return None
+        # The commands carry samples in a byte and frequencies in 32 bits
+        if not 0 <= samples <= 0xFF:
+            return None
+        start = int(start)
+        step = 0
+        if points > 1:
+            step = int((stop - start) // (points - 1))
+        if min(start, start + (points - 1) * step) < 0 or max(start, start + (points - 1) * step) > 0xFFFFFFFF:
+            return None
+        if out is None:
+            out = SweepResult.alloc(points)
+        elif len(out) != points:
+            return None
+        freqs = out.freq
+        for i in range(points):
+            freqs[i] = start + i * step
+        return out
+
+    def _sweep_run(self, res, cal, samples, precision):
+        """
+        Measures the points of res
+        :return: generator of the number of points done so far
+        """
+        freqs, rs, xs, ok = res.freq, res.rs, res.xs, res.ok
+        points = len(res)
+        step = freqs[1] - freqs[0] if points > 1 else 0
+
+        # Full precision or too few points for a batch: one command per point
+        # The command frames of the whole sweep are encoded upfront in one buffer
+        if precision == "full" or points < 4:
+            frames = encode_sweep(freqs, None, cal, samples)
+            r = [0]
+            x = [0]
+            for i in range(points):
+                o = i * CMD_FRAME_SIZE
+                if self._measure(frames[o:o + CMD_FRAME_SIZE], freqs[i], r, x, cal, samples) < 0:
+                    ok[i] = 0
+                    rs[i] = xs[i] = math.nan
+                else:
+                    rs[i] = r[0][0]
+                    xs[i] = x[0][0]
+                    ok[i] = 1
+                yield i + 1
+            return
+
+        # Four points per command; the last partial batch is aligned to the end of the sweep so it
+        # never measures beyond stop, re-measuring some of the previous points instead
+        starts = array(_U32, range(0, points - 3, 4))
+        if points % 4:
+            starts.append(points - 4)
+        frames = encode_sweep(array(_U32, (freqs[i] for i in starts)), step, cal, samples)
+        r = array('f', bytes(16))
+        x = array('f', bytes(16))
+        i = 0
+        o = 0
+        while i < points:
+            new = i
+            if i + 4 > points:
+                i = points - 4
+            if self._measure_ext(frames[o:o + CMD_FRAME_SIZE], freqs[i], step, r, x, cal, samples) < 0:
+                for k in range(new, i + 4):
+                    ok[k] = 0
+                    rs[k] = xs[k] = math.nan
+            else:
+                rs[i:i + 4] = r
+                xs[i:i + 4] = x
+                ok[i:i + 4] = b'\x01\x01\x01\x01'
+            i += 4
+            o += CMD_FRAME_SIZE
+            yield i
+
     # ---------------------------------------------------------
     # Get version command: used to check the connection and dev params
     def _cmd_version(self):
@@ -269,9 +1196,8 @@ class Sark110:
         self._fw_protocol = 0
         self._fw_version = ""
 
-        snd = [0x0] * 19
-        snd[1] = 1
-        rcv = self._send_rcv(snd)
+        _CMD_VERSION.pack_into(self._snd, 0, 0, CMD_VERSION)
+        rcv = self._send_rcv(self._snd)
         if rcv[0] != 79:
             return -2
         self._fw_protocol = (rcv[2] << 8) & 0xFF00
@@ -314,98 +1240,64 @@ class Sark110:
     # ---------------------------------------------------------
     # half float decompress
     def _half2float(self, byte1, byte2):
-        hfs = (byte2 << 8) & 0xFF00
-        hfs += byte1 & 0xFF
-        temp = self.__half2float(hfs)
-        res_pack = struct.pack('I', temp)
-        return struct.unpack('f', res_pack)[0]
-
-    def __half2float(self, float16):
-        s = int((float16 >> 15) & 0x00000001)  # sign
-        e = int((float16 >> 10) & 0x0000001f)  # exponent
-        f = int(float16 & 0x000003ff)  # fraction
-
-        if e == 0:
-            if f == 0:
-                return int(s << 31)
-            else:
-                while not (f & 0x00000400):
-                    f = f << 1
-                    e -= 1
-                e += 1
-                f &= ~0x00000400
-            # print(s,e,f)
-        elif e == 31:
-            if f == 0:
-                return int((s << 31) | 0x7f800000)
-            else:
-                return int((s << 31) | 0x7f800000 | (f << 13))
-
-        e = e + (127 - 15)
-        f = f << 13
-        return int((s << 31) | (e << 23) | f)
+        return _half2float(((byte2 << 8) & 0xFF00) | (byte1 & 0xFF))
 
     # ---------------------------------------------------------
-    def _short2bytes(self, n):
-        """
-        short to buffer array
-        :param n:
-        :return:
-        """
-        b = bytearray([0, 0])
-        b[0] = n & 0xFF
-        n >>= 8
-        b[1] = n & 0xFF
-        return b
+    def _drain(self, timeout_ms):
+        try:
+            self._handler.drain(timeout_ms)
+        except (IOError, OSError, ValueError):
+            pass
 
-    def _int2bytes(self, n):
+    def _send_rcv(self, snd, retries=None, key=None):
         """
-        int to buffer array
-        :param n:
-        :return:
+        Sends a command and waits for its reply, retrying on failure
+        :param snd:     command frame
+        :param retries: retries after the first attempt; None for the policy ones
+        :param key:     key of the learned deadline; None for (command id, samples)
+        :return: reply; 18 zeros on failure
         """
-        b = bytearray([0, 0, 0, 0])
-        b[0] = n & 0xFF
-        n >>= 8
-        b[1] = n & 0xFF
-        n >>= 8
-        b[2] = n & 0xFF
-        n >>= 8
-        b[3] = n & 0xFF
-        return b
-
-    # ---------------------------------------------------------
-    def _send_rcv(self, snd):
-        # Windows: pywinusb
-        if os.name == 'nt':
-            try:
-                report = self._handler.find_output_reports()[0]
-                self.event.clear()
-                report.set_raw_data(snd)
-                report.send()
-                self.event.wait()
-                return _g_rcv[1:18]
-            except:
-                return [0] * 18
-        # Linux: hidapi
-        else:
+        policy = self._policy
+        stats = self._stats
+        if retries is None:
+            retries = policy.retries
+        if key is None:
+            key = (snd[1], snd[7])
+        timeout = policy.timeout_ms(key)
+        for attempt in range(retries + 1):
+            if attempt:
+                if stats is not None:
+                    stats.record(snd[1], 0., "retry")
+                self._drain(policy.drain_ms)
+                timeout = policy.backoff(timeout)
+            else:
+                # Replies carry no sequence number: one left over from an earlier command would be
+                # taken as the answer to this one, so flush them first
+                self._drain(0)
+            t0 = time.perf_counter()
+            rcv = None
             try:
                 self._handler.write(snd)
-                return self._handler.read(18, WAIT_HID_DATA_MS)
-            except:
-                return [0] * 18
-
-    def _rx_handler(self, data):
-        """
-        Handler called when a report is received
-        :param data:
-        :return:
-        """
-        global _g_rcv
-        _g_rcv = data.copy()
-        self.event.set()
-
-    # ---------------------------------------------------------
-    _g_rcv = [0xff] * 19
-    if os.name == 'nt':
-        event = threading.Event()
+                rcv = self._handler.read(timeout)
+            except (IOError, OSError, ValueError):
+                result = "error"
+            else:
+                if not rcv:
+                    result = "timeout"
+                elif len(rcv) < 18:
+                    result = "short"
+                else:
+                    result = "ok"
+            rtt = time.perf_counter() - t0
+            if stats is not None:
+                stats.record(snd[1], rtt, result, len(snd), len(rcv) if rcv else 0)
+            if result == "ok":
+                policy.update(key, rtt)
+                if attempt:
+                    # The replies of the attempts that timed out may still come; wait for them, so they
+                    # are not taken as the answer to the next command. The reply may be a view of the
+                    # transport buffer, which the drain overwrites.
+                    rcv = bytes(rcv)
+                    self._drain(timeout)
+                return rcv
+        return [0] * 18
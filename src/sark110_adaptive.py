@@ -0,0 +1,161 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import math
+from collections import namedtuple
+
+from sark110 import *
+from sark110_rf import z2vswr
+
+Resonance = namedtuple('Resonance', ['freq', 'rs', 'vswr'])
+Bandwidth = namedtuple('Bandwidth', ['low', 'high', 'min_vswr', 'min_freq'])
+
+
+class AdaptiveSweepResult:
+    """
+    Result of an adaptive sweep: resonances (X crossing zero), bandwidths below the VSWR limit and
+    every point measured, in frequency order
+    """
+
+    def __init__(self, resonances, bandwidths, points, round_trips):
+        self.resonances = resonances
+        self.bandwidths = bandwidths
+        self.points = points
+        self.round_trips = round_trips
+
+    def __repr__(self):
+        return "AdaptiveSweepResult({} resonances, {} bandwidths, {} points, {} round trips)".format(
+            len(self.resonances), len(self.bandwidths), len(self.points), self.round_trips)
+
+
+def _interp(f0, f1, y0, y1, y):
+    if y1 == y0:
+        return (f0 + f1) / 2
+    return f0 + (f1 - f0) * (y - y0) / (y1 - y0)
+
+
+# ---------------------------------------------------------
+def adaptive_sweep(device, start: int, stop: int, coarse_points=101, freq_tol=1000, vswr_tol=0.05,
+                   vswr_limit=2., change_tol=0.25, max_round_trips=2000, cal=True, samples=1, z0=50.):
+    """
+    Finds resonances and VSWR bandwidths with few measurements: a coarse sweep, then the intervals
+    where X crosses zero, VSWR crosses vswr_limit, or VSWR or |Z| change fastest are split in five with
+    one measure_ext command each, until they are narrower than freq_tol (or, for the VSWR limit
+    crossings, their VSWR differs less than vswr_tol)
+    :param device:          connected Sark110
+    :param start:           start frequency in hertz
+    :param stop:            stop frequency in hertz
+    :param coarse_points:   points of the initial sweep
+    :param freq_tol:        frequency resolution in hertz
+    :param vswr_tol:        VSWR resolution of the bandwidth edges
+    :param vswr_limit:      VSWR defining the bandwidth
+    :param change_tol:      relative change of VSWR or |Z| between neighbours that triggers refining
+    :param max_round_trips: command budget for the refining
+    :param cal:             True to get OSL calibrated data; False to get uncalibrated data
+    :param samples:         number of samples for averaging
+    :param z0:              reference impedance
+    :return: AdaptiveSweepResult; None on error
+    """
+    coarse = device.sweep(start, stop, coarse_points, cal, samples)
+    if coarse is None:
+        return None
+    points = {}
+    for (f, r, x), v in zip(coarse, z2vswr(coarse, z0=z0).tolist()):
+        if not math.isnan(r):
+            points[f] = (r, x, v)
+    round_trips = (coarse_points + 3) // 4
+
+    r4 = [0.] * 4
+    x4 = [0.] * 4
+    done = set()
+    while round_trips < max_round_trips:
+        freqs = sorted(points)
+        todo = []
+        for fa, fb in zip(freqs, freqs[1:]):
+            if fb - fa <= max(freq_tol, 4) or (fa, fb) in done:
+                continue
+            ra, xa, va = points[fa]
+            rb, xb, vb = points[fb]
+            if (xa < 0) != (xb < 0):
+                todo.append((fa, fb))
+            elif (va < vswr_limit) != (vb < vswr_limit) and abs(va - vb) > vswr_tol:
+                todo.append((fa, fb))
+            else:
+                za = math.hypot(ra, xa)
+                zb = math.hypot(rb, xb)
+                if abs(va - vb) / min(va, vb) > change_tol or abs(za - zb) / max(min(za, zb), 1e-3) > change_tol:
+                    todo.append((fa, fb))
+        if not todo:
+            break
+        for fa, fb in todo:
+            if round_trips >= max_round_trips:
+                break
+            step = (fb - fa) // 5
+            round_trips += 1
+            if device.measure_ext(fa + step, step, r4, x4, cal, samples) < 0:
+                done.add((fa, fb))
+                continue
+            v4 = z2vswr(r4, x4, z0).tolist()
+            for k in range(4):
+                points[fa + (k + 1) * step] = (r4[k], x4[k], v4[k])
+
+    freqs = sorted(points)
+    res = SweepResult.alloc(len(freqs))
+    for i, f in enumerate(freqs):
+        res.freq[i] = f
+        res.rs[i], res.xs[i] = points[f][:2]
+
+    # Resonances: X crossing zero
+    resonances = []
+    for fa, fb in zip(freqs, freqs[1:]):
+        ra, xa, va = points[fa]
+        rb, xb, vb = points[fb]
+        if (xa < 0) != (xb < 0):
+            f = _interp(fa, fb, xa, xb, 0.)
+            t = (f - fa) / (fb - fa)
+            resonances.append(Resonance(f, ra + t * (rb - ra), va + t * (vb - va)))
+
+    # Bandwidths: runs of points below the VSWR limit, with interpolated edges
+    bandwidths = []
+    low = None
+    vmin = (math.inf, 0)
+    for i, f in enumerate(freqs):
+        v = points[f][2]
+        if v < vswr_limit:
+            if low is None:
+                low = f if i == 0 else _interp(freqs[i - 1], f, points[freqs[i - 1]][2], v, vswr_limit)
+                vmin = (math.inf, 0)
+            if v < vmin[0]:
+                vmin = (v, f)
+        elif low is not None:
+            high = _interp(freqs[i - 1], f, points[freqs[i - 1]][2], v, vswr_limit)
+            bandwidths.append(Bandwidth(low, high, vmin[0], vmin[1]))
+            low = None
+    if low is not None:
+        bandwidths.append(Bandwidth(low, freqs[-1], vmin[0], vmin[1]))
+
+    return AdaptiveSweepResult(resonances, bandwidths, res, round_trips)
@@ -0,0 +1,298 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sark110 import *
+from sark110 import _U32
+
+ARCHIVE_MAGIC = b'S110ARC\x00'
+ARCHIVE_VERSION = 1
+
+# magic, version, header size, points, dev_name, fw_protocol, fw_version, cal, samples, created
+_HEADER = struct.Struct('<8sHII32si16sBBxxd')
+# time, seq, crc32 of the record (with crc zeroed) ahead of the rs and xs float32 arrays
+_REC_HEAD = struct.Struct('<dII')
+
+
+def _record_size(points: int) -> int:
+    return _REC_HEAD.size + 8 * points
+
+
+def _read_header(f):
+    raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ValueError("not a sark110 archive")
+    (magic, version, header_size, points, dev_name, fw_protocol, fw_version, cal, samples,
+     created) = _HEADER.unpack(raw)
+    if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+        raise ValueError("not a sark110 archive")
+    freq = array(_U32)
+    freq.frombytes(f.read(4 * points))
+    meta = {
+        "dev_name": dev_name.rstrip(b'\x00').decode('ascii', 'replace'),
+        "fw_protocol": fw_protocol,
+        "fw_version": fw_version.rstrip(b'\x00').decode('ascii', 'replace'),
+        "cal": bool(cal),
+        "samples": samples,
+        "created": created,
+    }
+    return header_size, freq, meta
+
+
+def _record_ok(rec, seq) -> bool:
+    t, s, crc = _REC_HEAD.unpack_from(rec)
+    return s == seq and crc == zlib.crc32(_REC_HEAD.pack(t, s, 0) + rec[_REC_HEAD.size:])
+
+
+# ---------------------------------------------------------
+class ArchiveWriter:
+    """
+    Append-only binary archive of sweeps taken on one frequency grid.
+    The header holds dev_name, fw_protocol, fw_version, cal, samples and the frequencies; then come
+    fixed-size records: timestamp (float64), sequence number, CRC32 and the rs and xs float32 arrays.
+    Failed points are stored as NaN, which is how the reader tells them.
+    Each record is written with a single write; a torn or corrupt tail left by a crash is detected
+    by its size, sequence number and CRC, and cut off when the archive is opened again.
+    """
+
+    def __init__(self, path, freq=None, dev_name="", fw_protocol=-1, fw_version="", cal=True, samples=1,
+                 sync=False):
+        """
+        Opens an archive for appending, creating it if it does not exist
+        :param path:        file name
+        :param freq:        frequency grid (hertz) for a new archive; ignored if it exists
+        :param dev_name:    device name, for a new archive
+        :param fw_protocol: device protocol, for a new archive
+        :param fw_version:  device firmware version, for a new archive
+        :param cal:         calibrated data flag, for a new archive
+        :param samples:     averaging samples, for a new archive
+        :param sync:        True to fsync after every record
+        """
+        self._sync = sync
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            if freq is None:
+                raise ValueError("a new archive needs its frequency grid")
+            self._create(path, freq, dev_name, fw_protocol, fw_version, cal, samples)
+        self._f = open(path, 'r+b')
+        self._header_size, self.freq, self.meta = _read_header(self._f)
+        self._rec_size = _record_size(len(self.freq))
+        self.count = self._recover()
+
+    @classmethod
+    def for_device(cls, path, device, freq, cal=True, samples=1, sync=False):
+        """
+        Opens an archive for the sweeps of a connected Sark110
+        """
+        return cls(path, freq, device.dev_name, device.fw_protocol, device.fw_version, cal, samples, sync)
+
+    @staticmethod
+    def _create(path, freq, dev_name, fw_protocol, fw_version, cal, samples):
+        freq = array(_U32, [int(f) for f in freq])
+        size = _HEADER.size + 4 * len(freq)
+        header_size = (size + 7) & ~7
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, header_size, len(freq),
+                                 dev_name.encode('ascii', 'replace')[:32], fw_protocol,
+                                 fw_version.encode('ascii', 'replace')[:16], 1 if cal else 0, samples, time.time()))
+            f.write(freq.tobytes())
+            f.write(bytes(header_size - size))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self) -> int:
+        """
+        Cuts off a torn or corrupt tail
+        :return: number of valid records
+        """
+        size = os.fstat(self._f.fileno()).st_size
+        n = max(0, (size - self._header_size) // self._rec_size)
+        self.last_time = -math.inf
+        while n:
+            self._f.seek(self._header_size + (n - 1) * self._rec_size)
+            rec = self._f.read(self._rec_size)
+            if _record_ok(rec, n - 1):
+                self.last_time = _REC_HEAD.unpack_from(rec)[0]
+                break
+            n -= 1
+        end = self._header_size + n * self._rec_size
+        if end != size:
+            self._f.truncate(end)
+        self._f.seek(end)
+        return n
+
+    def append(self, res: SweepResult, timestamp=None) -> int:
+        """
+        Appends a sweep taken on the archive grid
+        :param res:         SweepResult
+        :param timestamp:   time of the sweep; now by default. Timestamps must not go backwards, as
+                            readers search them: an older one is rejected, while the clock going back
+                            (e.g. an NTP step) repeats the time of the last record until it catches up.
+        :return: <0 err; >0 ok
+        """
+        if len(res) != len(self.freq):
+            return -1
+        if timestamp is None:
+            t = max(time.time(), self.last_time)
+        elif timestamp < self.last_time:
+            return -2
+        else:
+            t = timestamp
+        rs, xs = res.rs, res.xs
+        if res.failed:
+            rs = array('f', rs)
+            xs = array('f', xs)
+            for i, ok in enumerate(res.ok):
+                if not ok:
+                    rs[i] = xs[i] = math.nan
+        data = rs.tobytes() + xs.tobytes()
+        crc = zlib.crc32(_REC_HEAD.pack(t, self.count, 0) + data)
+        self._f.write(_REC_HEAD.pack(t, self.count, crc) + data)
+        self._f.flush()
+        if self._sync:
+            os.fsync(self._f.fileno())
+        self.count += 1
+        self.last_time = t
+        return 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    Reads an archive through mmap: records are numpy views of the file, and time ranges are found
+    by binary search on the timestamps, touching only the pages needed
+    """
+
+    def __init__(self, path):
+        """
+        :param path:    file name
+        """
+        if np is None:
+            raise ImportError("Error: ArchiveReader requires numpy")
+        self._f = open(path, 'rb')
+        self._header_size, freq, self.meta = _read_header(self._f)
+        self.freq = np.frombuffer(freq, dtype=np.uint32)
+        points = len(freq)
+        self._dtype = np.dtype([('time', '<f8'), ('seq', '<u4'), ('crc', '<u4'),
+                                ('rs', '<f4', (points,)), ('xs', '<f4', (points,))])
+        self._mm = None
+        self.records = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Maps the records appended since opening
+        """
+        size = os.fstat(self._f.fileno()).st_size
+        n = max(0, (size - self._header_size) // self._dtype.itemsize)
+        # The previous map is released when the views taken from it are gone
+        self._mm = None
+        if n:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.records = np.frombuffer(self._mm, dtype=self._dtype, count=n, offset=self._header_size)
+            # A crash may leave a corrupt last record (an open for append cuts it off)
+            if not _record_ok(self.records[-1:].tobytes(), n - 1):
+                self.records = self.records[:-1]
+        else:
+            self.records = np.zeros(0, dtype=self._dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def times(self):
+        return self.records['time']
+
+    def __getitem__(self, i) -> SweepResult:
+        rs = self.records['rs'][i]
+        xs = self.records['xs'][i]
+        # failed points are stored as NaN
+        ok = (~(np.isnan(rs) | np.isnan(xs))).astype(np.uint8)
+        return SweepResult(self.freq, rs, xs, ok)
+
+    def time_range(self, t0=None, t1=None):
+        """
+        Records within [t0, t1), as views of the file
+        :param t0:  start time; None from the first
+        :param t1:  end time; None to the last
+        :return: (times, rs, xs) arrays of shapes (n,), (n, points), (n, points)
+        """
+        times = self.records['time']
+        i0 = 0 if t0 is None else int(np.searchsorted(times, t0, 'left'))
+        i1 = len(times) if t1 is None else int(np.searchsorted(times, t1, 'left'))
+        recs = self.records[i0:i1]
+        return recs['time'], recs['rs'], recs['xs']
+
+    def verify(self) -> int:
+        """
+        Checks the CRC of every record
+        :return: index of the first bad record; -1 if all are good
+        """
+        for i in range(len(self.records)):
+            if not _record_ok(self.records[i:i + 1].tobytes(), i):
+                return i
+        return -1
+
+    def close(self):
+        self.records = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # views of the records still in use; the map is released with them
+                pass
+        self._mm = None
+        if self._f is not None:
+            self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
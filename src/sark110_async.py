@@ -0,0 +1,187 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import asyncio
+import queue
+import threading
+
+from sark110 import *
+
+
+def _set_result(fut, res):
+    if not fut.done():
+        fut.set_result(res)
+
+
+def _set_exception(fut, ex):
+    if not fut.done():
+        fut.set_exception(ex)
+
+
+class AsyncSark110:
+    """
+    asyncio interface of Sark110.
+    One worker thread owns the device and runs the commands in submission order, so any number of
+    coroutines can await commands concurrently without locks and without blocking the event loop.
+    """
+
+    def __init__(self, transport=None, policy=None, device=None):
+        """
+        :param transport:   Sark110Transport backend; None for the platform default
+        :param policy:      RetryPolicy; None for the default one
+        :param device:      existing Sark110 to drive instead of creating one
+        """
+        if device is None:
+            device = Sark110(transport, policy)
+        self._device = device
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    @property
+    def device(self) -> Sark110:
+        return self._device
+
+    @property
+    def fw_version(self) -> str:
+        return self._device.fw_version
+
+    @property
+    def fw_protocol(self) -> int:
+        return self._device.fw_protocol
+
+    @property
+    def dev_name(self) -> str:
+        return self._device.dev_name
+
+    @property
+    def max_freq(self) -> int:
+        return self._device.max_freq
+
+    @property
+    def min_freq(self) -> int:
+        return self._device.min_freq
+
+    @property
+    def is_connected(self) -> bool:
+        return self._device.is_connected
+
+    async def open(self) -> int:
+        """
+        Starts the worker, opens the device and connects to it
+        :return: <0 err; >0 ok
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="sark110-io", daemon=True)
+            self._thread.start()
+        rc = await self._submit(self._device.open)
+        if rc < 0:
+            return rc
+        return await self._submit(self._device.connect)
+
+    async def close(self):
+        """
+        Closes the device and stops the worker once the pending commands are done
+        :return:
+        """
+        if self._thread is None:
+            return
+        await self._submit(self._device.close)
+        self._queue.put(None)
+        thread = self._thread
+        self._thread = None
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    async def measure(self, freq: int, cal=True, samples=1):
+        """
+        Takes one measurement sample at the specified frequency
+        :return: (rs, xs); None on error
+        """
+        return await self._submit(self._measure, freq, cal, samples)
+
+    async def measure_ext(self, freq: int, step: int, cal=True, samples=1):
+        """
+        Takes four measurement samples starting at the specified frequency and incremented at the specified step
+        :return: (rs, xs) lists of four values; None on error
+        """
+        return await self._submit(self._measure_ext, freq, step, cal, samples)
+
+    async def sweep(self, start: int, stop: int, points: int, cal=True, samples=1, precision="half"):
+        """
+        Takes a linear sweep between start and stop; see Sark110.sweep
+        :return: SweepResult; None on error
+        """
+        return await self._submit(self._device.sweep, start, stop, points, cal, samples, precision)
+
+    async def buzzer(self, freq=0, duration=0) -> int:
+        return await self._submit(self._device.buzzer, freq, duration)
+
+    async def reset(self) -> int:
+        return await self._submit(self._device.reset)
+
+    async def call(self, fn, *args):
+        """
+        Runs fn(device, *args) in the worker, serialized with the other commands
+        """
+        return await self._submit(fn, self._device, *args)
+
+    # ---------------------------------------------------------
+    def _submit(self, fn, *args):
+        if self._thread is None:
+            raise RuntimeError("AsyncSark110 is not open")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.put((fn, args, loop, fut))
+        return fut
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args, loop, fut = item
+            if fut.cancelled():
+                continue
+            try:
+                res = fn(*args)
+            except BaseException as ex:
+                loop.call_soon_threadsafe(_set_exception, fut, ex)
+            else:
+                loop.call_soon_threadsafe(_set_result, fut, res)
+
+    def _measure(self, freq, cal, samples):
+        rs = [0]
+        xs = [0]
+        if self._device.measure(freq, rs, xs, cal, samples) < 0:
+            return None
+        return rs[0][0], xs[0][0]
+
+    def _measure_ext(self, freq, step, cal, samples):
+        rs = [0.] * 4
+        xs = [0.] * 4
+        if self._device.measure_ext(freq, step, rs, xs, cal, samples) < 0:
+            return None
+        return rs, xs
@@ -0,0 +1,172 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import numpy as np
+
+from sark110 import *
+from sark110_plan import plan_sweep, run_plan
+
+
+class WelfordAccumulator:
+    """
+    Streaming mean and variance of R and X at each point of a frequency grid (Welford's method),
+    updated for all the points of a read at once
+    """
+
+    def __init__(self, points: int):
+        """
+        :param points:  number of points
+        """
+        self.n = np.zeros(points, dtype=np.int64)
+        self.mean_rs = np.zeros(points)
+        self.mean_xs = np.zeros(points)
+        self._m2_rs = np.zeros(points)
+        self._m2_xs = np.zeros(points)
+
+    def update(self, rs, xs, index=None):
+        """
+        Adds one read of the points; NaN values (failed points) are skipped
+        :param rs:      real parts
+        :param xs:      imag parts
+        :param index:   indexes of the points read; None for all
+        """
+        rs = np.asarray(rs, dtype=np.float64)
+        xs = np.asarray(xs, dtype=np.float64)
+        if index is None:
+            index = np.arange(len(self.n))
+        good = ~(np.isnan(rs) | np.isnan(xs))
+        index, rs, xs = np.asarray(index)[good], rs[good], xs[good]
+        self.n[index] += 1
+        n = self.n[index]
+        d = rs - self.mean_rs[index]
+        self.mean_rs[index] += d / n
+        self._m2_rs[index] += d * (rs - self.mean_rs[index])
+        d = xs - self.mean_xs[index]
+        self.mean_xs[index] += d / n
+        self._m2_xs[index] += d * (xs - self.mean_xs[index])
+
+    def std(self):
+        """
+        :return: (std of rs, std of xs) arrays; NaN where there are less than two reads
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.where(self.n > 1, self.n - 1, np.nan)
+            return np.sqrt(self._m2_rs / d), np.sqrt(self._m2_xs / d)
+
+    def stderr(self):
+        """
+        :return: (standard error of the mean of rs, of xs) arrays
+        """
+        sr, sx = self.std()
+        root_n = np.sqrt(self.n)
+        return sr / root_n, sx / root_n
+
+
+class AveragedSweep:
+    """
+    Sweep averaged on the host: mean values, their standard errors and the reads taken at each point
+    """
+
+    def __init__(self, result, se_rs, se_xs, repeats, samples):
+        self.result = result
+        self.se_rs = se_rs
+        self.se_xs = se_xs
+        self.repeats = repeats
+        self.samples = samples
+
+    def __repr__(self):
+        return "AveragedSweep({} points, {} reads)".format(len(self.result), int(self.repeats.sum()))
+
+
+# ---------------------------------------------------------
+def averaged_sweep(device, start: int, stop: int, points: int, target_se=0.1, samples=1, min_repeats=3,
+                   max_repeats=50, cal=True, precision="half") -> AveragedSweep:
+    """
+    Repeats a linear sweep until the standard error of the mean of R and X reaches target_se at every
+    point; after the first min_repeats passes only the points still above the target are measured again
+    (packed into measure_ext batches by the planner), so quiet bands stop early and noisy ones get more reads
+    :param device:      connected Sark110
+    :param start:       start frequency in hertz
+    :param stop:        stop frequency in hertz
+    :param points:      number of points
+    :param target_se:   target standard error of R and X, in ohms
+    :param samples:     device averaging samples of every read
+    :param min_repeats: reads of every point
+    :param max_repeats: maximum reads of a point
+    :param cal:         True to get OSL calibrated data; False to get uncalibrated data
+    :param precision:   "half" or "full"
+    :return: AveragedSweep; None on error
+    """
+    acc = WelfordAccumulator(points)
+    res = None
+    for _ in range(max(2, min_repeats)):
+        res = device.sweep(start, stop, points, cal, samples, precision, res)
+        if res is None:
+            return None
+        acc.update(res.rs, res.xs)
+    freq = np.asarray(res.freq)
+
+    for _ in range(max(2, min_repeats), max_repeats):
+        se_rs, se_xs = acc.stderr()
+        todo = np.flatnonzero(~((se_rs <= target_se) & (se_xs <= target_se)) & (acc.n < max_repeats))
+        if not len(todo):
+            break
+        if precision == "full":
+            # no run is long enough: every point with measure
+            plan = plan_sweep(freq[todo].tolist(), device.min_freq, device.max_freq, min_run=5)
+        else:
+            plan = plan_sweep(freq[todo].tolist(), device.min_freq, device.max_freq)
+        part = run_plan(device, plan, cal, samples)
+        acc.update(part.rs, part.xs, todo)
+
+    out = SweepResult.alloc(points)
+    np.asarray(out.freq)[:] = freq
+    # points never read are failed: NaN, as in the other sweeps
+    read = acc.n > 0
+    np.asarray(out.rs)[:] = np.where(read, acc.mean_rs, np.nan)
+    np.asarray(out.xs)[:] = np.where(read, acc.mean_xs, np.nan)
+    np.asarray(out.ok)[:] = read
+    se_rs, se_xs = acc.stderr()
+    return AveragedSweep(out, se_rs, se_xs, acc.n, samples)
+
+
+def suggest_samples(acc: WelfordAccumulator, target_se: float, samples=1, candidates=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Smallest device averaging giving target_se from a single read, at each point, from the spread
+    of reads taken with the given samples (the noise falls with the square root of the samples)
+    :param acc:         accumulator with at least two reads per point
+    :param target_se:   target standard error of R and X, in ohms
+    :param samples:     samples used for the reads in acc
+    :param candidates:  allowed samples values, in increasing order
+    :return: array of samples per point; the largest candidate where even that is not enough
+    """
+    sr, sx = acc.std()
+    sigma1 = np.fmax(sr, sx) * np.sqrt(samples)
+    needed = (sigma1 / target_se) ** 2
+    cand = np.asarray(candidates)
+    k = np.searchsorted(cand, np.nan_to_num(needed, nan=cand[-1]), 'left')
+    return cand[np.minimum(k, len(cand) - 1)]
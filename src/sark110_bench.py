@@ -0,0 +1,248 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import argparse
+import json
+import time
+
+from sark110 import *
+from sark110_sim import SimTransport, AntennaLoad
+
+
+# ---------------------------------------------------------
+class TimingTransport(Sark110Transport):
+    """
+    Wraps a transport and records the round trip time of every command, by command id
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._t0 = 0.
+        self._cmd = 0
+        self.io_time = 0.
+        self.rtt = {}
+
+    def open(self) -> int:
+        return self._transport.open()
+
+    def close(self):
+        self._transport.close()
+
+    def write(self, snd):
+        self._cmd = snd[1]
+        self._t0 = time.perf_counter()
+        self._transport.write(snd)
+
+    def read(self, timeout_ms: int):
+        try:
+            return self._transport.read(timeout_ms)
+        finally:
+            dt = time.perf_counter() - self._t0
+            self.io_time += dt
+            self.rtt.setdefault(self._cmd, []).append(dt)
+
+    def fileno(self) -> int:
+        return self._transport.fileno()
+
+    def drain(self, timeout_ms=0) -> int:
+        return self._transport.drain(timeout_ms)
+
+    def reset(self):
+        self.io_time = 0.
+        self.rtt = {}
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile
+    :param values:  samples
+    :param p:       percentile, 0 to 100
+    :return:
+    """
+    if not values:
+        return 0.
+    v = sorted(values)
+    k = max(0, min(len(v) - 1, int(round(p / 100 * len(v) + 0.5)) - 1))
+    return v[k]
+
+
+def latency_stats(values) -> dict:
+    """
+    :param values:  latencies in seconds
+    :return: summary in ms
+    """
+    return {
+        "n": len(values),
+        "mean_ms": 1000 * sum(values) / len(values) if values else 0.,
+        "p50_ms": 1000 * percentile(values, 50),
+        "p95_ms": 1000 * percentile(values, 95),
+        "p99_ms": 1000 * percentile(values, 99),
+    }
+
+
+# ---------------------------------------------------------
+def bench_commands(device, timing, repeats=100) -> dict:
+    """
+    Latency of each command
+    :return: {command: latency stats}
+    """
+    freq = (device.min_freq + device.max_freq) // 2
+    step = 10000
+    rs = [0.] * 4
+    xs = [0.] * 4
+    calls = {
+        "version": lambda: device._cmd_version(),
+        "measure": lambda: device.measure(freq, rs, xs),
+        "measure_ext": lambda: device.measure_ext(freq, step, rs, xs),
+        "buzzer": lambda: device.buzzer(0, 1),
+    }
+    res = {}
+    for name, call in calls.items():
+        timing.reset()
+        n = repeats if name != "buzzer" else min(repeats, 10)
+        for _ in range(n):
+            call()
+        res[name] = latency_stats([dt for v in timing.rtt.values() for dt in v])
+    return res
+
+
+def bench_sweeps(device, timing, points_list, samples_list, precisions, repeats=3) -> list:
+    """
+    Throughput of sweeps of different sizes and averaging
+    :return: list of results, one per configuration
+    """
+    start = device.min_freq
+    stop = min(device.max_freq, 30000000)
+    res = []
+    for precision in precisions:
+        for samples in samples_list:
+            for points in points_list:
+                timing.reset()
+                wall = 0.
+                cpu = 0.
+                sweeps = []
+                failed = 0
+                failed_points = []
+                for _ in range(repeats):
+                    c0 = time.process_time()
+                    t0 = time.perf_counter()
+                    r = device.sweep(start, stop, points, samples=samples, precision=precision)
+                    dt = time.perf_counter() - t0
+                    cpu += time.process_time() - c0
+                    wall += dt
+                    sweeps.append(dt)
+                    # sweeps with failed points count as failed, with the number of points lost
+                    lost = points if r is None else r.failed
+                    failed_points.append(lost)
+                    if lost:
+                        failed += 1
+                rtt = [dt for v in timing.rtt.values() for dt in v]
+                res.append({
+                    "points": points,
+                    "samples": samples,
+                    "precision": precision,
+                    "repeats": repeats,
+                    "failed": failed,
+                    "failed_points": failed_points,
+                    "commands": len(rtt),
+                    "points_per_sec": points * repeats / wall if wall else 0.,
+                    "sweep": latency_stats(sweeps),
+                    "command": latency_stats(rtt),
+                    "wall_s": wall,
+                    "cpu_s": cpu,
+                    "io_wait_s": timing.io_time,
+                    "codec_s": max(0., wall - timing.io_time),
+                })
+    return res
+
+
+def run(sim=False, sim_latency_ms=1., points_list=(100, 1000), samples_list=(1, 4), precisions=("half", "full"),
+        repeats=3, cmd_repeats=100) -> dict:
+    """
+    Runs the benchmark against the device, or against the simulator when there is none (or sim is set)
+    :return: results, or None if the device could not be connected
+    """
+    timing = None
+    device = None
+    if not sim:
+        timing = TimingTransport(default_transport())
+        device = Sark110(timing)
+        if device.open() < 0 or device.connect() < 0:
+            device.close()
+            device = None
+    if device is None:
+        sim = True
+        timing = TimingTransport(SimTransport(AntennaLoad(14.2e6), latency_ms=sim_latency_ms))
+        device = Sark110(timing)
+        device.open()
+        if device.connect() < 0:
+            return None
+
+    res = {
+        "timestamp": time.time(),
+        "device": {
+            "simulated": sim,
+            "dev_name": device.dev_name,
+            "fw_protocol": device.fw_protocol,
+            "fw_version": device.fw_version,
+        },
+        "commands": bench_commands(device, timing, cmd_repeats),
+        "sweeps": bench_sweeps(device, timing, points_list, samples_list, precisions, repeats),
+    }
+    device.close()
+    return res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SARK-110 throughput and latency benchmark")
+    parser.add_argument("--sim", action="store_true", help="use the simulator even if a device is present")
+    parser.add_argument("--sim-latency", type=float, default=1., help="simulated round trip in ms")
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--samples", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--precision", nargs="+", default=["half", "full"], choices=["half", "full"])
+    parser.add_argument("--repeats", type=int, default=3, help="sweeps per configuration")
+    parser.add_argument("--cmd-repeats", type=int, default=100, help="calls per command")
+    parser.add_argument("-o", "--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    res = run(args.sim, args.sim_latency, args.points, args.samples, args.precision, args.repeats, args.cmd_repeats)
+    if res is None:
+        print("Device not connected")
+        exit(-1)
+
+    dev = res["device"]
+    print(dev["dev_name"], dev["fw_version"], "(simulated)" if dev["simulated"] else "")
+    for name, st in res["commands"].items():
+        print("%-12s p50 %7.3f  p95 %7.3f  p99 %7.3f ms" % (name, st["p50_ms"], st["p95_ms"], st["p99_ms"]))
+    for sw in res["sweeps"]:
+        print("%-4s %6d pts x%-3d %9.1f pts/s  io %6.3f s  codec %6.3f s  cpu %6.3f s" % (
+            sw["precision"], sw["points"], sw["samples"], sw["points_per_sec"], sw["io_wait_s"], sw["codec_s"],
+            sw["cpu_s"]))
+    with open(args.output, "w") as f:
+        json.dump(res, f, indent=2)
+    print("Results written to", args.output)
+    exit(1)
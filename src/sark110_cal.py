@@ -0,0 +1,188 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+from collections import OrderedDict
+
+import numpy as np
+
+from sark110 import *
+from sark110_rf import z2gamma
+
+
+def _gamma2z(gamma, z0):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return z0 * (1 + gamma) / (1 - gamma)
+
+
+def _interp_complex(f, fp, yp):
+    return np.interp(f, fp, yp.real) + 1j * np.interp(f, fp, yp.imag)
+
+
+class OSLCalibration:
+    """
+    Host-side open/short/load calibration (one-port, three error terms e00, e11, e10e01).
+    The terms are computed on the calibration grid and interpolated onto the grids they are applied to;
+    interpolated terms are cached per grid, so correcting many sweeps on the same grid costs one
+    vectorized pass.
+    """
+    # Grids whose interpolated terms are kept
+    CACHE_SIZE = 16
+
+    def __init__(self, freq, open_, short, load, z0=50., standards=(1., -1., 0.)):
+        """
+        :param freq:        calibration frequencies in hertz, increasing
+        :param open_:       uncalibrated SweepResult (or impedance array) of the open standard
+        :param short:       uncalibrated SweepResult (or impedance array) of the short standard
+        :param load:        uncalibrated SweepResult (or impedance array) of the load standard
+        :param z0:          reference impedance
+        :param standards:   actual reflection coefficients of open, short and load: scalars or arrays on
+                            the calibration grid; ideal by default
+        """
+        self.z0 = z0
+        self.freq = np.asarray(freq, dtype=np.float64)
+        gm = np.stack([self._gamma(m) for m in (open_, short, load)], axis=-1)
+        ga = np.stack([np.broadcast_to(np.asarray(s, dtype=np.complex128), self.freq.shape) for s in standards],
+                      axis=-1)
+        # gm = e00 + ga * gm * e11 - ga * de, with de = e00 * e11 - e10e01
+        a = np.stack([np.ones_like(gm), ga * gm, -ga], axis=-1)
+        e00, e11, de = np.moveaxis(np.linalg.solve(a, gm[..., None])[..., 0], -1, 0)
+        self.e00 = e00
+        self.e11 = e11
+        self.e10e01 = e00 * e11 - de
+        self._cache = OrderedDict()
+
+    def _gamma(self, m):
+        if isinstance(m, SweepResult):
+            return z2gamma(m, z0=self.z0)
+        return (np.asarray(m) - self.z0) / (np.asarray(m) + self.z0)
+
+    @classmethod
+    def capture(cls, device, start: int, stop: int, points: int, samples=4, z0=50., prompt=input):
+        """
+        Measures the standards (uncalibrated, full precision), asking to connect each of them
+        :param device:  connected Sark110
+        :param prompt:  called with a message before each standard; it returns when the standard is connected
+        :return: OSLCalibration; None on error
+        """
+        sweeps = []
+        for name in ("OPEN", "SHORT", "LOAD"):
+            prompt("Connect the {} standard and press enter".format(name))
+            res = device.sweep(start, stop, points, cal=False, samples=samples, precision="full")
+            if res is None or res.failed:
+                return None
+            sweeps.append(res)
+        return cls(np.asarray(sweeps[0].freq), *sweeps, z0=z0)
+
+    def terms(self, freq):
+        """
+        Error terms on a frequency grid, interpolated from the calibration grid and cached per grid
+        :param freq:    frequencies in hertz
+        :return: (e00, e11, e10e01) complex arrays
+        """
+        freq = np.asarray(freq)
+        key = (freq.dtype.str, freq.tobytes())
+        t = self._cache.get(key)
+        if t is not None:
+            self._cache.move_to_end(key)
+            return t
+        f = freq.astype(np.float64)
+        if len(f) == len(self.freq) and np.array_equal(f, self.freq):
+            t = (self.e00, self.e11, self.e10e01)
+        else:
+            t = tuple(_interp_complex(f, self.freq, e) for e in (self.e00, self.e11, self.e10e01))
+        self._cache[key] = t
+        while len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return t
+
+    def correct_gamma(self, freq, gamma):
+        """
+        Corrects measured reflection coefficients
+        :param freq:    frequencies in hertz, shape (points,)
+        :param gamma:   measured values, shape (..., points): one sweep or many
+        :return: corrected values, same shape
+        """
+        e00, e11, e10e01 = self.terms(freq)
+        d = gamma - e00
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return d / (e11 * d + e10e01)
+
+    def correct(self, freq, rs, xs):
+        """
+        Corrects uncalibrated impedances, e.g. all the sweeps of an archive at once
+        :param freq:    frequencies in hertz, shape (points,)
+        :param rs:      real parts, shape (..., points)
+        :param xs:      imag parts, shape (..., points)
+        :return: (rs, xs) corrected float32 arrays, same shape
+        """
+        z = np.asarray(rs, dtype=np.float64) + 1j * np.asarray(xs, dtype=np.float64)
+        z = _gamma2z(self.correct_gamma(freq, (z - self.z0) / (z + self.z0)), self.z0)
+        return z.real.astype(np.float32), z.imag.astype(np.float32)
+
+    def apply(self, res: SweepResult) -> SweepResult:
+        """
+        Corrects an uncalibrated sweep
+        :param res: SweepResult taken with cal=False
+        :return: new SweepResult
+        """
+        freq = np.asarray(res.freq)
+        rs, xs = self.correct(freq, res.rs, res.xs)
+        return SweepResult(freq.copy(), rs, xs, np.asarray(res.ok).copy())
+
+    def apply_archive(self, reader, t0=None, t1=None):
+        """
+        Corrects the uncalibrated sweeps of an archive within a time range, in one pass
+        :param reader:  ArchiveReader of an archive taken with cal=False
+        :param t0:      start time; None from the first
+        :param t1:      end time; None to the last
+        :return: (times, rs, xs) with rs and xs of shape (sweeps, points)
+        """
+        times, rs, xs = reader.time_range(t0, t1)
+        rs, xs = self.correct(reader.freq, rs, xs)
+        return times, rs, xs
+
+    def save(self, path):
+        """
+        Saves the error terms to a .npz file
+        """
+        np.savez(path, freq=self.freq, e00=self.e00, e11=self.e11, e10e01=self.e10e01, z0=self.z0)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads error terms saved by save()
+        :return: OSLCalibration
+        """
+        d = np.load(path)
+        cal = cls.__new__(cls)
+        cal.z0 = float(d["z0"])
+        cal.freq = d["freq"]
+        cal.e00 = d["e00"]
+        cal.e11 = d["e11"]
+        cal.e10e01 = d["e10e01"]
+        cal._cache = OrderedDict()
+        return cal
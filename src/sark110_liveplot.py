@@ -0,0 +1,241 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patches import Circle
+
+from sark110 import *
+from sark110_rf import z2gamma, z2vswr
+
+
+class LivePlot:
+    """
+    Live VSWR and Smith chart display of a sweep, fed with the chunks of Sark110.iter_sweep as they arrive.
+    Only the line data is redrawn, blitted over a saved background, at most max_fps times per second;
+    the VSWR trace is decimated to a min/max pair per pixel column and the Smith trace to a couple of
+    points per column, so the cost of a redraw does not grow with the sweep length.
+    A new sweep overwrites the previous one from the left, so the old trace stays visible ahead of the cursor.
+    """
+
+    def __init__(self, start: int, stop: int, points: int, z0=50., vswr_max=10., max_fps=20.,
+                 title='SARK-110', fig=None):
+        """
+        :param start:       start frequency in hertz
+        :param stop:        stop frequency in hertz
+        :param points:      number of points
+        :param z0:          reference impedance
+        :param vswr_max:    top of the VSWR scale
+        :param max_fps:     redraw rate limit; 0 to redraw on every chunk
+        :param title:       figure title
+        :param fig:         matplotlib figure to draw on; None to create one
+        """
+        # Frequencies are taken from the chunks as they arrive; this is the grid of Sark110.sweep
+        self.freq = (start + np.arange(points) * (int((stop - start) // (points - 1)) if points > 1 else 0)) / 1e6
+        self.z0 = z0
+        self.vswr = np.full(points, np.nan)
+        self.gamma = np.full(points, np.nan, dtype=np.complex128)
+        self._n = 0
+        self._interval = 1. / max_fps if max_fps else 0.
+        self._last = 0.
+        self._bg = None
+        self._cols = 0
+        self._starts = None
+        self._stride = 1
+
+        if fig is None:
+            fig = plt.figure(figsize=(12, 5.5))
+        self.fig = fig
+        fig.suptitle(title)
+        ax = self.ax_vswr = fig.add_subplot(1, 2, 1)
+        ax.set_xlim(self.freq[0], self.freq[-1] if self.freq[-1] > self.freq[0] else self.freq[0] + 1)
+        ax.set_ylim(1., vswr_max)
+        ax.set_xlabel('Freq MHz')
+        ax.set_ylabel('SWR')
+        ax.grid(True)
+        self.vswr_line, = ax.plot([], [], animated=True)
+
+        ax = self.ax_smith = fig.add_subplot(1, 2, 2)
+        self._smith_grid(ax)
+        self.smith_line, = ax.plot([], [], animated=True)
+        self.cursor, = ax.plot([], [], 'o', animated=True)
+
+        self._blit = fig.canvas.supports_blit
+        self._cid = fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    @staticmethod
+    def _smith_grid(ax):
+        ax.set_aspect('equal')
+        ax.set_xlim(-1.05, 1.05)
+        ax.set_ylim(-1.05, 1.05)
+        ax.axis('off')
+        edge = Circle((0, 0), 1, fill=False, color='k', lw=1)
+        ax.add_patch(edge)
+        ax.plot([-1, 1], [0, 0], color='0.6', lw=.5)
+        for r in (0.2, 0.5, 1., 2., 5.):
+            ax.add_patch(Circle((r / (1 + r), 0), 1 / (1 + r), fill=False, color='0.6', lw=.5))
+        for x in (0.2, 0.5, 1., 2., 5.):
+            for s in (1, -1):
+                arc = Circle((1, s / x), 1 / x, fill=False, color='0.6', lw=.5)
+                ax.add_patch(arc)
+                arc.set_clip_path(edge)
+
+    def show(self):
+        """
+        Shows the figure without blocking
+        """
+        plt.show(block=False)
+        plt.pause(.1)
+
+    @property
+    def is_open(self) -> bool:
+        """
+        False once the figure window is closed
+        """
+        return plt.fignum_exists(self.fig.number)
+
+    def new_sweep(self):
+        """
+        Starts drawing a new sweep from the first point
+        """
+        self._n = 0
+
+    def feed(self, chunk: SweepResult):
+        """
+        Adds the next chunk of the sweep, in frequency order, and redraws if the rate limit allows
+        :param chunk:   SweepResult chunk, e.g. from Sark110.iter_sweep
+        """
+        i = self._n
+        j = min(i + len(chunk), len(self.freq))
+        n = j - i
+        self.freq[i:j] = np.asarray(chunk.freq[:n], dtype=np.float64) / 1e6
+        self.vswr[i:j] = z2vswr(chunk.rs[:n], chunk.xs[:n], self.z0)
+        self.gamma[i:j] = z2gamma(chunk.rs[:n], chunk.xs[:n], self.z0)
+        self._n = j
+        if j == len(self.freq) or time.perf_counter() - self._last >= self._interval:
+            self.redraw()
+
+    def redraw(self):
+        """
+        Redraws the traces now
+        """
+        canvas = self.fig.canvas
+        if self._bg is None:
+            # first draw; _on_draw saves the background and draws the traces
+            canvas.draw()
+        elif self._blit:
+            self._update_lines()
+            canvas.restore_region(self._bg)
+            self._draw_lines()
+            canvas.blit(self.fig.bbox)
+        else:
+            self._update_lines()
+            canvas.draw_idle()
+        canvas.flush_events()
+        self._last = time.perf_counter()
+
+    def _on_draw(self, event):
+        """
+        Full redraws (first show, resizes): saves the background and works out the decimation for the
+        new size of the axes
+        """
+        canvas = self.fig.canvas
+        if event is not None and event.canvas is not canvas:
+            return
+        points = len(self.freq)
+        cols = max(int(self.ax_vswr.bbox.width), 1)
+        if cols != self._cols:
+            self._cols = cols
+            self._starts = None
+            if points > 2 * cols:
+                self._starts = np.unique(np.arange(cols) * points // cols)
+            self._stride = max(1, points // (2 * max(int(self.ax_smith.bbox.width), 1)))
+        if self._blit:
+            self._bg = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            self._bg = True
+        self._update_lines()
+        self._draw_lines()
+
+    def _update_lines(self):
+        starts = self._starts
+        if starts is None:
+            self.vswr_line.set_data(self.freq, self.vswr)
+        else:
+            # min and max of each pixel column, so peaks and dips narrower than a pixel are kept
+            x = np.repeat(self.freq[starts], 2)
+            y = np.empty(len(x))
+            y[0::2] = np.fmin.reduceat(self.vswr, starts)
+            y[1::2] = np.fmax.reduceat(self.vswr, starts)
+            self.vswr_line.set_data(x, y)
+        g = self.gamma[::self._stride]
+        self.smith_line.set_data(g.real, g.imag)
+        if self._n:
+            g = self.gamma[self._n - 1]
+            self.cursor.set_data([g.real], [g.imag])
+
+    def _draw_lines(self):
+        self.ax_vswr.draw_artist(self.vswr_line)
+        self.ax_smith.draw_artist(self.smith_line)
+        self.ax_smith.draw_artist(self.cursor)
+
+
+# ---------------------------------------------------------
+def live_sweep(device, start: int, stop: int, points: int, sweeps=1, cal=True, samples=1, chunk_points=64,
+               plot=None, **kwargs):
+    """
+    Sweeps and displays the points as they arrive
+    :param device:          connected Sark110
+    :param start:           start frequency in hertz
+    :param stop:            stop frequency in hertz
+    :param points:          number of points
+    :param sweeps:          number of sweeps; 0 to sweep until the window is closed
+    :param cal:             True to get OSL calibrated data; False to get uncalibrated data
+    :param samples:         number of samples for averaging
+    :param chunk_points:    minimum number of points per chunk
+    :param plot:            LivePlot to draw on; None to create one (kwargs are passed to it)
+    :return: SweepResult of the last sweep; None on error
+    """
+    if plot is None:
+        plot = LivePlot(start, stop, points, **kwargs)
+        plot.show()
+    res = SweepResult.alloc(points)
+    n = 0
+    while plot.is_open and (not sweeps or n < sweeps):
+        plot.new_sweep()
+        done = 0
+        for chunk in device.iter_sweep(start, stop, points, cal, samples, chunk_points=chunk_points, out=res):
+            plot.feed(chunk)
+            done += len(chunk)
+            if not plot.is_open:
+                break
+        if not done:
+            return None
+        n += 1
+    return res
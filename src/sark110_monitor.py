@@ -0,0 +1,188 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import threading
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sark110 import *
+
+
+class SweepRing:
+    """
+    Ring buffer of the last N sweeps of points each, preallocated once.
+    Slots are SweepResult views of the shared arrays: the writer fills next_slot() and commits it;
+    readers get the latest sweeps without copying. A slot is only rewritten after size - 1 newer
+    sweeps, so check seq() when holding one for long.
+    """
+
+    def __init__(self, size: int, points: int):
+        """
+        :param size:    number of sweeps kept, 2 at least: the slot being written is never the latest one
+        :param points:  points per sweep
+        """
+        if size < 2:
+            raise ValueError("SweepRing needs two slots at least")
+        self._size = size
+        self._points = points
+        self._whole = SweepResult.alloc(size * points)
+        self._times = array('d', bytes(8 * size))
+        self._slots = [self._whole[k * points:(k + 1) * points] for k in range(size)]
+        self._count = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def points(self) -> int:
+        return self._points
+
+    @property
+    def count(self) -> int:
+        """
+        Sweeps committed since creation
+        """
+        return self._count
+
+    def __len__(self):
+        return min(self._count, self._size)
+
+    def next_slot(self) -> SweepResult:
+        """
+        Slot for the writer to fill; it is not visible to readers until commit()
+        """
+        return self._slots[self._count % self._size]
+
+    def commit(self, timestamp=None):
+        """
+        Publishes the slot returned by next_slot()
+        :param timestamp:   time of the sweep; now by default
+        """
+        self._times[self._count % self._size] = time.time() if timestamp is None else timestamp
+        self._count += 1
+
+    def latest(self, age=0):
+        """
+        One of the last sweeps, without copying
+        :param age: 0 for the latest, 1 for the previous one...
+        :return: (seq, timestamp, SweepResult); None if not available
+        """
+        if age >= len(self) or age < 0:
+            return None
+        seq = self._count - 1 - age
+        k = seq % self._size
+        return seq, self._times[k], self._slots[k]
+
+    def seq(self, seq: int) -> bool:
+        """
+        :param seq: sequence number given by latest()
+        :return: True if the sweep is still held (not overwritten)
+        """
+        return self._count - self._size <= seq < self._count
+
+    def to_numpy(self):
+        """
+        Whole ring as numpy arrays of shape (size, points), without copying; rows are in slot order
+        :return: (freq, rs, xs, ok, times)
+        """
+        if np is None:
+            raise ImportError("Error: SweepRing.to_numpy requires numpy")
+        shape = (self._size, self._points)
+        freq, rs, xs = self._whole.to_numpy()
+        ok = np.asarray(self._whole.ok)
+        return freq.reshape(shape), rs.reshape(shape), xs.reshape(shape), ok.reshape(shape), np.asarray(self._times)
+
+
+class SweepMonitor:
+    """
+    Repeats a sweep forever into a SweepRing, from a background thread
+    """
+
+    def __init__(self, device, start: int, stop: int, points: int, size=16, cal=True, samples=1, precision="half",
+                 interval=0.):
+        """
+        :param device:      connected Sark110
+        :param start:       start frequency in hertz
+        :param stop:        stop frequency in hertz
+        :param points:      number of points
+        :param size:        number of sweeps kept, 2 at least
+        :param cal:         True to get OSL calibrated data; False to get uncalibrated data
+        :param samples:     number of samples for averaging
+        :param precision:   "half" or "full"
+        :param interval:    pause between sweeps in seconds
+        """
+        self.device = device
+        self.ring = SweepRing(size, points)
+        self._args = (start, stop, points, cal, samples, precision)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self, count=None) -> int:
+        """
+        Sweeps in the calling thread until stop() or count sweeps
+        :return: <0 err; >0 ok
+        """
+        n = 0
+        while not self._stop.is_set() and (count is None or n < count):
+            t = time.time()
+            if self.device.sweep(*self._args, out=self.ring.next_slot()) is None:
+                return -1
+            self.ring.commit(t)
+            n += 1
+            if self.interval:
+                self._stop.wait(self.interval)
+        return 1
+
+    def start(self):
+        """
+        Starts sweeping in a background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="sark110-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread after the current sweep
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def latest(self, age=0):
+        """
+        See SweepRing.latest
+        """
+        return self.ring.latest(age)
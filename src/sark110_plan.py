@@ -0,0 +1,168 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import math
+from array import array
+
+from sark110 import *
+
+
+class SweepPlan:
+    """
+    Commands needed to measure an arbitrary list of frequencies.
+    batches are measure_ext commands: (freq, step, [(position, point), ...]), each measuring the points at
+    freq + position * step; singles are measure commands: (freq, point). Points index the unique,
+    sorted (clamped) frequencies in freqs; index maps every requested frequency to its point.
+    """
+
+    def __init__(self, freqs, index, batches, singles):
+        self.freqs = freqs
+        self.index = index
+        self.batches = batches
+        self.singles = singles
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.batches) + len(self.singles)
+
+    @property
+    def saved(self) -> int:
+        """
+        Round trips saved compared with one measure per point
+        """
+        return len(self.freqs) - self.round_trips
+
+    def __repr__(self):
+        return "SweepPlan({} points, {} measure_ext, {} measure, {} round trips saved)".format(
+            len(self.freqs), len(self.batches), len(self.singles), self.saved)
+
+
+# ---------------------------------------------------------
+def _fit_run(u, i, k, tolerance, min_freq, max_freq):
+    """
+    Places u[i:i + k] on an arithmetic run of four points
+    :return: (start, step, first position) or None
+    """
+    step = int(round((u[i + k - 1] - u[i]) / (k - 1)))
+    if step <= 0:
+        return None
+    for j in range(1, k - 1):
+        if abs(u[i + j] - (u[i] + j * step)) > tolerance:
+            return None
+    # The device always measures four points: keep the unused ones within the frequency range
+    for pos in range(0, 4 - k + 1):
+        start = u[i] - pos * step
+        if start >= min_freq and start + 3 * step <= max_freq:
+            return start, step, pos
+    return None
+
+
+def plan_sweep(freqs, min_freq: int, max_freq: int, tolerance=0, min_run=2) -> SweepPlan:
+    """
+    Packs a list of frequencies into the fewest round trips, grouping runs of evenly spaced points
+    into measure_ext commands and measuring the rest one by one
+    :param freqs:       frequencies in hertz, any order; duplicates are measured once
+    :param min_freq:    lowest frequency of the device
+    :param max_freq:    highest frequency of the device
+    :param tolerance:   max deviation in hertz of a point from its run
+    :param min_run:     shortest run worth a measure_ext command (2 to 4)
+    :return: SweepPlan
+    """
+    req = [min(max_freq, max(min_freq, int(round(f)))) for f in freqs]
+    u = sorted(set(req))
+    pos = {f: i for i, f in enumerate(u)}
+    index = [pos[f] for f in req]
+    n = len(u)
+
+    # best[i]: fewest round trips for u[i:]; choice[i]: run length taken at i and its placement
+    best = [0] * (n + 1)
+    choice = [None] * n
+    for i in range(n - 1, -1, -1):
+        best[i] = best[i + 1] + 1
+        choice[i] = (1, None)
+        for k in range(min(4, n - i), max(2, min_run) - 1, -1):
+            if best[i + k] + 1 < best[i]:
+                fit = _fit_run(u, i, k, tolerance, min_freq, max_freq)
+                if fit is not None:
+                    best[i] = best[i + k] + 1
+                    choice[i] = (k, fit)
+
+    batches = []
+    singles = []
+    i = 0
+    while i < n:
+        k, fit = choice[i]
+        if fit is None:
+            singles.append((u[i], i))
+        else:
+            start, step, first = fit
+            batches.append((start, step, [(first + j, i + j) for j in range(k)]))
+        i += k
+    return SweepPlan(u, index, batches, singles)
+
+
+def run_plan(device, plan: SweepPlan, cal=True, samples=1) -> SweepResult:
+    """
+    Measures a plan
+    :param device:  connected Sark110
+    :param plan:    SweepPlan
+    :param cal:     True to get OSL calibrated data; False to get uncalibrated data
+    :param samples: number of samples for averaging
+    :return: SweepResult in the order of the requested frequencies, with the frequencies actually measured
+    """
+    n = len(plan.freqs)
+    freq = array('d', [0.]) * n
+    rs = array('f', [math.nan]) * n
+    xs = array('f', [math.nan]) * n
+    ok = bytearray(n)
+
+    r = [0.] * 4
+    x = [0.] * 4
+    for start, step, points in plan.batches:
+        measured = device.measure_ext(start, step, r, x, cal, samples) > 0
+        for p, i in points:
+            freq[i] = start + p * step
+            if measured:
+                rs[i] = r[p]
+                xs[i] = x[p]
+                ok[i] = 1
+    r = [0]
+    x = [0]
+    for f, i in plan.singles:
+        freq[i] = f
+        if device.measure(f, r, x, cal, samples) > 0:
+            rs[i] = r[0][0]
+            xs[i] = x[0][0]
+            ok[i] = 1
+
+    res = SweepResult.alloc(len(plan.index))
+    for j, i in enumerate(plan.index):
+        res.freq[j] = int(freq[i])
+        res.rs[j] = rs[i]
+        res.xs[j] = xs[i]
+        res.ok[j] = ok[i]
+    return res
@@ -0,0 +1,109 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sark110 import *
+
+# Result of one analyzer in a pool operation
+PoolResult = namedtuple('PoolResult', ['dev_name', 'fw_version', 'path', 'result'])
+
+
+class Sark110Pool:
+    """
+    Several analyzers driven in parallel: each device has its own worker thread, so commands to one
+    device run in order while all the devices work at the same time.
+    """
+
+    def __init__(self, transports=None, policy_factory=None):
+        """
+        :param transports:      Sark110Transport per analyzer; None for every device found by find_devices()
+        :param policy_factory:  callable returning a RetryPolicy for each device; None for the default
+        """
+        if transports is None:
+            transports = [default_transport(d["path"]) for d in find_devices()]
+        self._devices = []
+        for transport in transports:
+            policy = policy_factory() if policy_factory is not None else None
+            self._devices.append(Sark110(transport, policy))
+        # worker of each connected device
+        self._workers = {}
+
+    @property
+    def devices(self) -> list:
+        """
+        Connected devices
+        """
+        return [dev for dev in self._devices if dev.is_connected]
+
+    def __len__(self):
+        return len(self.devices)
+
+    def open(self) -> int:
+        """
+        Opens and connects every analyzer; those that fail are left out
+        :return: number of connected analyzers
+        """
+        self._shutdown()
+        for dev in self._devices:
+            if dev.open() > 0 and dev.connect() < 0:
+                dev.close()
+        self._workers = {dev: ThreadPoolExecutor(max_workers=1, thread_name_prefix="sark110-pool")
+                         for dev in self.devices}
+        return len(self.devices)
+
+    def _shutdown(self):
+        for worker in self._workers.values():
+            worker.shutdown()
+        self._workers = {}
+
+    def close(self):
+        """
+        Closes every analyzer
+        :return:
+        """
+        self._shutdown()
+        for dev in self._devices:
+            dev.close()
+
+    def map(self, fn, *args) -> list:
+        """
+        Runs fn(device, *args) on every analyzer at once
+        :return: list of PoolResult, one per analyzer
+        """
+        devices = [dev for dev in self.devices if dev in self._workers]
+        futures = [self._workers[dev].submit(fn, dev, *args) for dev in devices]
+        return [PoolResult(dev.dev_name, dev.fw_version, dev.transport.path, fut.result())
+                for dev, fut in zip(devices, futures)]
+
+    def sweep(self, start: int, stop: int, points: int, cal=True, samples=1, precision="half") -> list:
+        """
+        Takes the same sweep on every analyzer at once; see Sark110.sweep
+        :return: list of PoolResult holding a SweepResult (None on error), one per analyzer
+        """
+        return self.map(Sark110.sweep, start, stop, points, cal, samples, precision)
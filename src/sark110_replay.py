@@ -0,0 +1,236 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import argparse
+import struct
+import time
+
+from sark110 import *
+
+TRANSCRIPT_MAGIC = b'SK110HID'
+TRANSCRIPT_VERSION = 1
+# magic, version, created (epoch seconds)
+_HEADER = struct.Struct('<8sHd')
+# kind, time since the start of the capture in seconds, payload length; the payload follows
+_EVENT = struct.Struct('<BdB')
+
+EV_OPEN = 1         # payload: open() return code, signed byte
+EV_CLOSE = 2
+EV_WRITE = 3        # payload: command frame
+EV_READ = 4         # payload: reply frame; empty on timeout
+EV_ERROR = 5        # payload: message of the IOError raised by write or read
+
+_EV_NAMES = {EV_OPEN: "open", EV_CLOSE: "close", EV_WRITE: "write", EV_READ: "read", EV_ERROR: "error"}
+
+
+def read_transcript(path) -> list:
+    """
+    Reads a capture
+    :param path:    file name
+    :return: list of (time, kind, payload) events
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError("not a sark110 transcript")
+    magic, version, _ = _HEADER.unpack_from(data)
+    if magic != TRANSCRIPT_MAGIC or version != TRANSCRIPT_VERSION:
+        raise ValueError("not a sark110 transcript")
+    events = []
+    o = _HEADER.size
+    # a capture cut short by a crash may end with a partial event; it is skipped
+    while o + _EVENT.size <= len(data):
+        kind, t, n = _EVENT.unpack_from(data, o)
+        o += _EVENT.size
+        if o + n > len(data):
+            break
+        events.append((t, kind, data[o:o + n]))
+        o += n
+    return events
+
+
+# ---------------------------------------------------------
+class RecordingTransport(Sark110Transport):
+    """
+    Wraps a transport and logs every command and reply with its time to a compact binary file,
+    for ReplayTransport to play it back:
+
+        device = Sark110(RecordingTransport(default_transport(), 'unit42.hid'))
+
+    Each command takes 67 bytes: the command, its reply and the empty read of the flush that precedes it
+    (replies left by timed out attempts and retries add more). The file is flushed after every reply, so
+    a crash loses at most one exchange.
+    """
+
+    def __init__(self, transport, path):
+        """
+        :param transport:   Sark110Transport to record
+        :param path:        file name; overwritten
+        """
+        self._transport = transport
+        self._f = open(path, 'wb')
+        self._f.write(_HEADER.pack(TRANSCRIPT_MAGIC, TRANSCRIPT_VERSION, time.time()))
+        self._t0 = time.perf_counter()
+
+    @property
+    def path(self):
+        return self._transport.path
+
+    def _log(self, kind, payload=b''):
+        if self._f is None:
+            return
+        payload = bytes(payload)[:255]
+        self._f.write(_EVENT.pack(kind, time.perf_counter() - self._t0, len(payload)))
+        self._f.write(payload)
+
+    def open(self) -> int:
+        rc = self._transport.open()
+        self._log(EV_OPEN, struct.pack('<b', max(-128, min(127, rc))))
+        self.flush()
+        return rc
+
+    def close(self):
+        self._transport.close()
+        self._log(EV_CLOSE)
+        self.flush()
+
+    def write(self, snd):
+        self._log(EV_WRITE, snd)
+        try:
+            self._transport.write(snd)
+        except (IOError, OSError, ValueError) as e:
+            self._log(EV_ERROR, str(e).encode('utf-8', 'replace'))
+            raise
+
+    def read(self, timeout_ms: int):
+        try:
+            rcv = self._transport.read(timeout_ms)
+        except (IOError, OSError, ValueError) as e:
+            self._log(EV_ERROR, str(e).encode('utf-8', 'replace'))
+            self.flush()
+            raise
+        self._log(EV_READ, rcv)
+        self.flush()
+        return rcv
+
+    def fileno(self) -> int:
+        return self._transport.fileno()
+
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def finish(self):
+        """
+        Closes the capture file; the wrapped transport is left as is
+        """
+        if self._f is not None:
+            self._f.close()
+        self._f = None
+
+
+class ReplayTransport(Sark110Transport):
+    """
+    Plays a capture of RecordingTransport back to Sark110, without the device. The commands sent must
+    be those recorded; a different one raises RuntimeError, as the replay has diverged.
+    With speed > 0 each reply (or timeout) takes the time it took the device, divided by speed;
+    with speed 0 replies are immediate, to benchmark the host side deterministically.
+    """
+    path = "replay"
+
+    def __init__(self, path, speed=1.):
+        """
+        :param path:    capture file name
+        :param speed:   time scale of the replies; 0 as fast as possible
+        """
+        self.events = read_transcript(path)
+        self.speed = speed
+        self._i = 0
+        self._t_write = 0.
+
+    def rewind(self):
+        """
+        Restarts the replay from the first event, e.g. to repeat a benchmark
+        """
+        self._i = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self.events) - self._i
+
+    def _next(self, kinds, what):
+        if self._i >= len(self.events):
+            raise RuntimeError("replay ended at {}".format(what))
+        ev = self.events[self._i]
+        if ev[1] not in kinds:
+            raise RuntimeError("replay diverged at event {}: {} instead of {}".format(
+                self._i, _EV_NAMES.get(ev[1], ev[1]), what))
+        self._i += 1
+        return ev
+
+    def _peek(self, kind) -> bool:
+        return self._i < len(self.events) and self.events[self._i][1] == kind
+
+    def open(self) -> int:
+        if self._peek(EV_OPEN):
+            return struct.unpack('<b', self._next((EV_OPEN,), "open")[2])[0]
+        return 1
+
+    def close(self):
+        if self._peek(EV_CLOSE):
+            self._i += 1
+
+    def write(self, snd):
+        t, _, payload = self._next((EV_WRITE,), "write")
+        if payload != bytes(snd):
+            raise RuntimeError("replay diverged at event {}: command {} instead of {}".format(
+                self._i - 1, bytes(snd).hex(), payload.hex()))
+        self._t_write = t
+        if self._peek(EV_ERROR):
+            raise IOError(self._next((EV_ERROR,), "write")[2].decode('utf-8', 'replace'))
+
+    def read(self, timeout_ms: int):
+        t, kind, payload = self._next((EV_READ, EV_ERROR), "read")
+        if self.speed:
+            delay = min((t - self._t_write) / self.speed, timeout_ms / 1000)
+            if delay > 0:
+                time.sleep(delay)
+        if kind == EV_ERROR:
+            raise IOError(payload.decode('utf-8', 'replace'))
+        return payload
+
+
+# ---------------------------------------------------------
+def _dump(path):
+    for t, kind, payload in read_transcript(path):
+        print("{:12.6f} {:6} {}".format(t, _EV_NAMES.get(kind, kind), payload.hex()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dump a SARK-110 HID transcript")
+    parser.add_argument("path", help="capture file")
+    _dump(parser.parse_args().path)
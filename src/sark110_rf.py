@@ -0,0 +1,180 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import numpy as np
+
+# |gamma| above which VSWR is reported as 99.999
+GAMMA_MAX = 0.980197824
+VSWR_MAX = 99.999
+
+
+def _rx(rs, xs):
+    """
+    :param rs:  real part of the impedance, array-like; or a SweepResult when xs is None
+    :param xs:  imag part of the impedance, array-like
+    :return: (rs, xs) float64 arrays
+    """
+    if xs is None:
+        rs, xs = rs.rs, rs.xs
+    return np.asarray(rs, dtype=np.float64), np.asarray(xs, dtype=np.float64)
+
+
+def z2gamma(rs, xs=None, z0=50 + 0j) -> np.ndarray:
+    """
+    Reflection coefficient
+    :param rs:  real part of the impedance; or a SweepResult
+    :param xs:  imag part of the impedance
+    :param z0:  reference impedance
+    :return: complex array
+    """
+    rs, xs = _rx(rs, xs)
+    z = rs + 1j * xs
+    return (z - z0) / (z + z0)
+
+
+def z2vswr(rs, xs=None, z0=50 + 0j) -> np.ndarray:
+    """
+    VSWR, clamped to 99.999
+    :param rs:  real part of the impedance; or a SweepResult
+    :param xs:  imag part of the impedance
+    :param z0:  reference impedance
+    :return: array
+    """
+    rs, xs = _rx(rs, xs)
+    z0 = complex(z0).real
+    gamma = np.sqrt(((rs - z0) ** 2 + xs ** 2) / ((rs + z0) ** 2 + xs ** 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        swr = (1 + gamma) / (1 - gamma)
+    return np.where(gamma > GAMMA_MAX, VSWR_MAX, swr)
+
+
+def z2return_loss(rs, xs=None, z0=50 + 0j) -> np.ndarray:
+    """
+    Return loss in dB (positive)
+    :param rs:  real part of the impedance; or a SweepResult
+    :param xs:  imag part of the impedance
+    :param z0:  reference impedance
+    :return: array
+    """
+    with np.errstate(divide='ignore'):
+        return -20 * np.log10(np.abs(z2gamma(rs, xs, z0)))
+
+
+def z2mag(rs, xs=None) -> np.ndarray:
+    """
+    Impedance magnitude
+    :return: array
+    """
+    rs, xs = _rx(rs, xs)
+    return np.hypot(rs, xs)
+
+
+def z2phase(rs, xs=None) -> np.ndarray:
+    """
+    Impedance phase in degrees
+    :return: array
+    """
+    rs, xs = _rx(rs, xs)
+    return np.degrees(np.arctan2(xs, rs))
+
+
+def z2parallel(rs, xs=None):
+    """
+    Parallel equivalent of the series impedance
+    :return: (rp, xp) arrays; inf where the series part is zero
+    """
+    rs, xs = _rx(rs, xs)
+    m2 = rs ** 2 + xs ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return m2 / rs, m2 / xs
+
+
+def x2lc(freq, xs) -> tuple:
+    """
+    Inductance or capacitance equivalent to a reactance
+    :param freq:    frequencies in hertz
+    :param xs:      reactances
+    :return: (l, c) arrays in henries and farads; NaN where the reactance has the other sign
+    """
+    w = 2 * np.pi * np.asarray(freq, dtype=np.float64)
+    xs = np.asarray(xs, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        l = np.where(xs > 0, xs / w, np.nan)
+        c = np.where(xs < 0, -1 / (w * xs), np.nan)
+    return l, c
+
+
+def z2q(rs, xs=None) -> np.ndarray:
+    """
+    Quality factor |X| / R
+    :return: array
+    """
+    rs, xs = _rx(rs, xs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs(xs) / rs
+
+
+def sweep_metrics(res, z0=50 + 0j) -> dict:
+    """
+    Every metric of a SweepResult, in one pass over its arrays
+    :param res: SweepResult
+    :param z0:  reference impedance
+    :return: dict of arrays: freq, rs, xs, gamma, vswr, return_loss, mag, phase, rp, xp,
+             ls, cs (series), lp, cp (parallel), q
+    """
+    freq = np.asarray(res.freq, dtype=np.float64)
+    rs, xs = _rx(res.rs, res.xs)
+    z = rs + 1j * xs
+    gamma = (z - z0) / (z + z0)
+    agamma = np.abs(gamma)
+    z0r = complex(z0).real
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # same as z2vswr, which uses the real part of z0
+        g = agamma if complex(z0).imag == 0 else np.sqrt(((rs - z0r) ** 2 + xs ** 2) / ((rs + z0r) ** 2 + xs ** 2))
+        vswr = np.where(g > GAMMA_MAX, VSWR_MAX, (1 + g) / (1 - g))
+        return_loss = -20 * np.log10(agamma)
+    mag = np.abs(z)
+    rp, xp = z2parallel(rs, xs)
+    ls, cs = x2lc(freq, xs)
+    lp, cp = x2lc(freq, xp)
+    return {
+        "freq": freq,
+        "rs": rs,
+        "xs": xs,
+        "gamma": gamma,
+        "vswr": vswr,
+        "return_loss": return_loss,
+        "mag": mag,
+        "phase": np.degrees(np.angle(z)),
+        "rp": rp,
+        "xp": xp,
+        "ls": ls,
+        "cs": cs,
+        "lp": lp,
+        "cp": cp,
+        "q": z2q(rs, xs),
+    }
@@ -0,0 +1,361 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import argparse
+import asyncio
+import json
+import socket
+import struct
+from array import array
+
+from sark110 import *
+from sark110 import _U32
+from sark110_async import AsyncSark110
+
+OP_SWEEP = 1
+OP_INFO = 2
+OP_MEASURE = 3
+
+PRECISIONS = ("half", "full")
+
+# op, device index, start, stop, points, cal, samples, precision (0 half, 1 full)
+REQUEST = struct.Struct('<BBIIIBBB')
+# status (<0 err; >0 ok), payload length
+RESPONSE = struct.Struct('<bI')
+# measure payload: rs, xs
+MEASURE = struct.Struct('<ff')
+
+
+def _step(start, stop, points):
+    # same grid as Sark110.sweep
+    return (stop - start) // (points - 1) if points > 1 else 0
+
+
+def _pack_result(res: SweepResult):
+    return [res.freq.cast('B'), res.rs.cast('B'), res.xs.cast('B'), res.ok.cast('B')]
+
+
+def _unpack_result(payload) -> SweepResult:
+    n = len(payload) // 13
+    freq = array(_U32)
+    freq.frombytes(payload[:4 * n])
+    rs = array('f')
+    rs.frombytes(payload[4 * n:8 * n])
+    xs = array('f')
+    xs.frombytes(payload[8 * n:12 * n])
+    return SweepResult(freq, rs, xs, bytearray(payload[12 * n:13 * n]))
+
+
+# ---------------------------------------------------------
+class _Device:
+    """
+    One analyzer of the server, with its queue of pending sweeps
+    """
+
+    def __init__(self, dev: AsyncSark110):
+        self.dev = dev
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.passes = 0
+        self.requests = 0
+
+
+class Sark110Server:
+    """
+    Local acquisition daemon: owns the analyzers and serves sweeps to any number of clients over a
+    Unix socket or TCP on localhost. Sweeps arriving within the coalescing window whose grids line up
+    (same step, calibration, samples and precision) and overlap or touch are taken in one device pass,
+    and each client gets its part. Measurements are queued as 1-point full precision sweeps, so the same
+    measurement asked by several clients is taken once.
+    """
+
+    def __init__(self, devices, coalesce_ms=20.):
+        """
+        :param devices:     list of AsyncSark110 (not yet open)
+        :param coalesce_ms: time to wait for more requests before sweeping
+        """
+        self._devices = [_Device(d) for d in devices]
+        self.coalesce_ms = coalesce_ms
+        self._tasks = []
+        self._server = None
+
+    async def start(self, path=None, port=None, host="127.0.0.1") -> int:
+        """
+        Opens the analyzers and starts listening
+        :param path:    Unix socket path
+        :param port:    TCP port, when path is None
+        :param host:    TCP address
+        :return: number of analyzers connected
+        """
+        n = 0
+        for d in self._devices:
+            if await d.dev.open() > 0:
+                n += 1
+                self._tasks.append(asyncio.ensure_future(self._dispatch(d)))
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._client, path)
+        else:
+            self._server = await asyncio.start_server(self._client, host, port)
+        return n
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for t in self._tasks:
+            t.cancel()
+        for d in self._devices:
+            await d.dev.close()
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server is not None else []
+
+    # ---------------------------------------------------------
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    raw = await reader.readexactly(REQUEST.size)
+                except asyncio.IncompleteReadError:
+                    break
+                op, idx, start, stop, points, cal, samples, precision = REQUEST.unpack(raw)
+                if idx >= len(self._devices) or not self._devices[idx].dev.is_connected:
+                    writer.write(RESPONSE.pack(-1, 0))
+                elif op == OP_INFO:
+                    writer.write(self._info(self._devices[idx]))
+                elif op == OP_MEASURE:
+                    try:
+                        res = await self._sweep(self._devices[idx], start, start, 1, bool(cal), samples, "full")
+                    except Exception:
+                        res = None
+                    if res is None or not res.ok[0]:
+                        writer.write(RESPONSE.pack(-2, 0))
+                    else:
+                        writer.write(RESPONSE.pack(1, MEASURE.size) + MEASURE.pack(res.rs[0], res.xs[0]))
+                elif op == OP_SWEEP and points > 0 and stop >= start and precision < len(PRECISIONS):
+                    try:
+                        res = await self._sweep(self._devices[idx], start, stop, points, bool(cal), samples,
+                                                PRECISIONS[precision])
+                    except Exception:
+                        # the device pass failed; the client gets an error instead of a closed connection
+                        res = None
+                    if res is None:
+                        writer.write(RESPONSE.pack(-2, 0))
+                    else:
+                        writer.write(RESPONSE.pack(1, 13 * len(res)))
+                        writer.writelines(_pack_result(res))
+                else:
+                    writer.write(RESPONSE.pack(-3, 0))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _info(self, d: _Device) -> bytes:
+        dev = d.dev
+        payload = json.dumps({
+            "dev_name": dev.dev_name,
+            "fw_protocol": dev.fw_protocol,
+            "fw_version": dev.fw_version,
+            "min_freq": dev.min_freq,
+            "max_freq": dev.max_freq,
+            "requests": d.requests,
+            "passes": d.passes,
+        }).encode()
+        return RESPONSE.pack(1, len(payload)) + payload
+
+    def _sweep(self, d: _Device, start, stop, points, cal, samples, precision):
+        fut = asyncio.get_running_loop().create_future()
+        d.pending.append(((start, stop, points, cal, samples, precision), fut))
+        d.requests += 1
+        d.wakeup.set()
+        return fut
+
+    async def _dispatch(self, d: _Device):
+        while True:
+            await d.wakeup.wait()
+            await asyncio.sleep(self.coalesce_ms / 1000)
+            d.wakeup.clear()
+            batch, d.pending = d.pending, []
+            for (ustart, upoints, cal, samples, precision), members in self._coalesce(batch):
+                d.passes += 1
+                ustop = ustart + (upoints - 1) * (members[0][1] if upoints > 1 else 0)
+                try:
+                    res = await d.dev.sweep(ustart, ustop, upoints, cal, samples, precision)
+                except Exception as ex:
+                    for _, _, _, fut in members:
+                        if not fut.done():
+                            fut.set_exception(ex)
+                    continue
+                for offset, _, points, fut in members:
+                    if not fut.done():
+                        fut.set_result(None if res is None else res[offset:offset + points])
+
+    @staticmethod
+    def _coalesce(batch):
+        """
+        Groups requests into device passes
+        :return: list of ((start, points, cal, samples, precision), [(offset, step, points, future), ...])
+        """
+        groups = {}
+        for (start, stop, points, cal, samples, precision), fut in batch:
+            step = _step(start, stop, points)
+            key = (step, start % step if step else start, cal, samples, precision)
+            groups.setdefault(key, []).append((start, points, fut))
+        passes = []
+        for (step, _, cal, samples, precision), reqs in groups.items():
+            reqs.sort(key=lambda r: r[0])
+            cur = None
+            for start, points, fut in reqs:
+                end = start + (points - 1) * step
+                if cur is not None and start <= cur[1] + step:
+                    cur[1] = max(cur[1], end)
+                    cur[2].append((start, points, fut))
+                else:
+                    cur = [start, end, [(start, points, fut)]]
+                    passes.append((step, cal, samples, precision, cur))
+        res = []
+        for step, cal, samples, precision, (ustart, uend, members) in passes:
+            if step:
+                upoints = (uend - ustart) // step + 1
+            else:
+                # repeated frequency (start == stop, or a span below points - 1 Hz): as many points as the
+                # longest request
+                upoints = max(points for _, points, _ in members)
+            res.append(((ustart, upoints, cal, samples, precision),
+                        [((start - ustart) // step if step else 0, step, points, fut)
+                         for start, points, fut in members]))
+        return res
+
+
+# ---------------------------------------------------------
+class Sark110Client:
+    """
+    Blocking client of Sark110Server
+    """
+
+    def __init__(self, path=None, port=None, host="127.0.0.1"):
+        """
+        :param path:    Unix socket path
+        :param port:    TCP port, when path is None
+        :param host:    TCP address
+        """
+        if path is not None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(path)
+        else:
+            self._sock = socket.create_connection((host, port))
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _recv(self, n):
+        buf = bytearray(n)
+        view = memoryview(buf)
+        while n:
+            k = self._sock.recv_into(view[-n:], n)
+            if not k:
+                raise IOError("connection closed")
+            n -= k
+        return buf
+
+    def _request(self, *args):
+        self._sock.sendall(REQUEST.pack(*args))
+        status, length = RESPONSE.unpack(self._recv(RESPONSE.size))
+        return status, self._recv(length)
+
+    def info(self, device=0):
+        """
+        :return: dict with the device characteristics; None on error
+        """
+        status, payload = self._request(OP_INFO, device, 0, 0, 0, 0, 0, 0)
+        if status < 0:
+            return None
+        return json.loads(payload.decode())
+
+    def measure(self, freq: int, cal=True, samples=1, device=0):
+        """
+        Takes one measurement; see Sark110.measure
+        :return: (rs, xs); None on error
+        """
+        try:
+            status, payload = self._request(OP_MEASURE, device, int(freq), 0, 1, 1 if cal else 0, samples, 1)
+        except struct.error:
+            # arguments out of the range of the request, caught before anything is sent
+            return None
+        if status < 0:
+            return None
+        return MEASURE.unpack(payload)
+
+    def sweep(self, start: int, stop: int, points: int, cal=True, samples=1, precision="half", device=0):
+        """
+        Takes a linear sweep; see Sark110.sweep
+        :return: SweepResult; None on error
+        """
+        try:
+            status, payload = self._request(OP_SWEEP, device, int(start), int(stop), points, 1 if cal else 0,
+                                            samples, PRECISIONS.index(precision))
+        except (struct.error, ValueError):
+            # arguments out of the range of the request, caught before anything is sent
+            return None
+        if status < 0:
+            return None
+        return _unpack_result(payload)
+
+
+async def _main(args):
+    if args.sim:
+        from sark110_sim import SimTransport, AntennaLoad
+        devices = [AsyncSark110(SimTransport(AntennaLoad(14.2e6), latency_ms=1.)) for _ in range(args.sim)]
+    else:
+        devices = [AsyncSark110(default_transport(d["path"])) for d in find_devices()]
+    server = Sark110Server(devices, args.coalesce)
+    n = await server.start(args.unix, args.port)
+    print(n, "analyzer(s) connected; listening on", args.unix or "127.0.0.1:{}".format(args.port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SARK-110 acquisition server")
+    parser.add_argument("--unix", help="Unix socket path")
+    parser.add_argument("--port", type=int, default=5110, help="TCP port on localhost, when --unix is not given")
+    parser.add_argument("--coalesce", type=float, default=20., help="coalescing window in ms")
+    parser.add_argument("--sim", type=int, default=0, help="serve this number of simulated analyzers")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,266 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import math
+import random
+import struct
+import time
+from collections import deque
+
+from sark110 import Sark110Transport
+
+# Limits of each device variant, as identified by Sark110._cmd_version
+SIM_VARIANTS = {
+    0x0100: (100000, 200000000),
+    0x0200: (10000, 230000000),
+    0x0300: (10000, 230000000),
+    0x0a00: (100000, 1000000000),
+}
+
+_STATUS_OK = 79
+_STATUS_ERR = 69
+_HALF_MAX = 65504.
+
+
+# ---------------------------------------------------------
+class SeriesRLCLoad:
+    """
+    Series R-L-C load
+    """
+
+    def __init__(self, r=50., l=0., c=0.):
+        """
+        :param r:   resistance in ohms
+        :param l:   inductance in henries
+        :param c:   capacitance in farads; 0 for none (short)
+        """
+        self.r = r
+        self.l = l
+        self.c = c
+
+    def impedance(self, freq: float) -> complex:
+        w = 2 * math.pi * freq
+        x = w * self.l
+        if self.c:
+            x -= 1 / (w * self.c)
+        return complex(self.r, x)
+
+
+class ParallelRLCLoad:
+    """
+    Parallel R-L-C load
+    """
+
+    def __init__(self, r=50., l=0., c=0.):
+        """
+        :param r:   resistance in ohms
+        :param l:   inductance in henries; 0 for none (open)
+        :param c:   capacitance in farads; 0 for none
+        """
+        self.r = r
+        self.l = l
+        self.c = c
+
+    def impedance(self, freq: float) -> complex:
+        w = 2 * math.pi * freq
+        y = complex(1 / self.r, w * self.c)
+        if self.l:
+            y -= 1j / (w * self.l)
+        if y == 0:
+            return complex(1e9, 0)
+        return 1 / y
+
+
+class AntennaLoad:
+    """
+    Simple resonant antenna: series RLC around the resonance, with radiation resistance growing
+    with the square of the frequency, plus an optional feed line stub capacitance
+    """
+
+    def __init__(self, f0=14.2e6, r0=50., q=10., r_loss=0., c_feed=0.):
+        """
+        :param f0:      resonance frequency in hertz
+        :param r0:      radiation resistance at resonance in ohms
+        :param q:       loaded Q
+        :param r_loss:  loss resistance in ohms
+        :param c_feed:  shunt capacitance at the feed point in farads
+        """
+        self.f0 = f0
+        self.r0 = r0
+        self.q = q
+        self.r_loss = r_loss
+        self.c_feed = c_feed
+        w0 = 2 * math.pi * f0
+        self._l = q * (r0 + r_loss) / w0
+        self._c = 1 / (w0 * w0 * self._l)
+
+    def impedance(self, freq: float) -> complex:
+        w = 2 * math.pi * freq
+        z = complex(self.r0 * (freq / self.f0) ** 2 + self.r_loss, w * self._l - 1 / (w * self._c))
+        if self.c_feed:
+            z = 1 / (1 / z + 1j * w * self.c_feed)
+        return z
+
+
+# ---------------------------------------------------------
+class SimTransport(Sark110Transport):
+    """
+    Simulated device speaking the SARK-110 HID protocol: version (1), measure (2), measure_ext (12),
+    buzzer (20) and reset (50).
+    Calibrated measurements return the load impedance; uncalibrated ones apply the raw bridge error
+    terms to it. Replies can be delayed, jittered and dropped.
+
+        device = Sark110(SimTransport(AntennaLoad(14.2e6)))
+    """
+    path = "sim"
+
+    def __init__(self, load=None, protocol=0x0300, version="1.3.0", latency_ms=0., jitter_ms=0., drop_rate=0.,
+                 noise=0., raw_error=(0.02 + 0.01j, 0.05 - 0.02j, 0.95 + 0.03j), seed=None):
+        """
+        :param load:        object with impedance(freq) -> complex; 50 ohms resistor by default
+        :param protocol:    fw protocol reported by the version command (0x01xx, 0x02xx, 0x03xx, 0x0axx)
+        :param version:     fw version string
+        :param latency_ms:  reply delay in ms
+        :param jitter_ms:   standard deviation of the reply delay in ms
+        :param drop_rate:   probability of losing a reply (0 to 1)
+        :param noise:       standard deviation of R and X for one sample, in ohms
+        :param raw_error:   (e00, e11, e10e01) error terms of uncalibrated measurements
+        :param seed:        random seed, for reproducible noise, jitter and drops
+        """
+        if load is None:
+            load = SeriesRLCLoad()
+        self.load = load
+        self.protocol = protocol
+        self.version = version
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.noise = noise
+        self.raw_error = raw_error
+        self.min_freq, self.max_freq = SIM_VARIANTS.get(protocol & 0xff00, (100000, 230000000))
+        self.commands = 0
+        self.buzzer_log = []
+        self._rnd = random.Random(seed)
+        self._is_open = False
+        # replies on their way: (arrival time, reply)
+        self._replies = deque()
+
+    def open(self) -> int:
+        self._is_open = True
+        self._replies.clear()
+        return 1
+
+    def close(self):
+        self._is_open = False
+        self._replies.clear()
+
+    def write(self, snd):
+        if not self._is_open:
+            raise IOError("device not open")
+        snd = bytes(snd)
+        self.commands += 1
+        if self.drop_rate and self._rnd.random() < self.drop_rate:
+            return
+        reply = self._execute(snd[1], snd[2:])
+        self._replies.append((time.perf_counter() + self.reply_delay_ms(snd) / 1000, reply))
+
+    def reply_delay_ms(self, snd) -> float:
+        """
+        Delay of the reply to a command; replies later than the read deadline still arrive, as
+        with the device
+        :param snd: command
+        :return: delay in ms
+        """
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay = max(0., self._rnd.gauss(delay, self.jitter_ms))
+        return delay
+
+    def read(self, timeout_ms: int):
+        if not self._is_open:
+            raise IOError("device not open")
+        if not self._replies or self._replies[0][0] - time.perf_counter() > timeout_ms / 1000:
+            time.sleep(timeout_ms / 1000)
+            return b''
+        wait = self._replies[0][0] - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        return self._replies.popleft()[1]
+
+    # ---------------------------------------------------------
+    def _execute(self, cmd, args):
+        if cmd == 1:
+            ver = self.version.encode('ascii')[:15]
+            return struct.pack('<BH15s', _STATUS_OK, self.protocol, ver)
+        if cmd == 2:
+            freq, cal, samples = struct.unpack_from('<IBB', args)
+            z = self._measure(freq, cal, samples)
+            if z is None:
+                return self._error()
+            return struct.pack('<Bff9x', _STATUS_OK, z.real, z.imag)
+        if cmd == 12:
+            freq, cal, samples, step = struct.unpack_from('<IBBI', args)
+            vals = []
+            for i in range(4):
+                z = self._measure(freq + i * step, cal, samples)
+                if z is None:
+                    return self._error()
+                vals.append(max(-_HALF_MAX, min(_HALF_MAX, z.real)))
+                vals.append(max(-_HALF_MAX, min(_HALF_MAX, z.imag)))
+            return struct.pack('<B8ex', _STATUS_OK, *vals)
+        if cmd == 20:
+            self.buzzer_log.append(struct.unpack_from('<HH', args))
+            return self._ok()
+        if cmd == 50:
+            return self._ok()
+        return self._error()
+
+    def _measure(self, freq, cal, samples):
+        if freq == 0:
+            return 0j
+        if not self.min_freq <= freq <= self.max_freq:
+            return None
+        z = self.load.impedance(freq)
+        if self.noise:
+            sd = self.noise / math.sqrt(max(1, samples))
+            z += complex(self._rnd.gauss(0, sd), self._rnd.gauss(0, sd))
+        if not cal:
+            e00, e11, e10e01 = self.raw_error
+            gamma = (z - 50) / (z + 50)
+            gamma = e00 + e10e01 * gamma / (1 - e11 * gamma)
+            if gamma == 1:
+                return complex(1e9, 0)
+            z = 50 * (1 + gamma) / (1 - gamma)
+        return z
+
+    @staticmethod
+    def _ok():
+        return struct.pack('<B17x', _STATUS_OK)
+
+    @staticmethod
+    def _error():
+        return struct.pack('<B17x', _STATUS_ERR)
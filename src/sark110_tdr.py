@@ -0,0 +1,211 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from sark110 import *
+from sark110_rf import z2gamma
+
+# Speed of light in vacuum, m/s
+C0 = 299792458.
+
+_WINDOWS = {
+    "rect": np.ones,
+    "hann": np.hanning,
+    "hamming": np.hamming,
+    "blackman": np.blackman,
+}
+
+
+def _window(name, n, beta):
+    if name == "kaiser":
+        return np.kaiser(n, beta)
+    if name not in _WINDOWS:
+        raise ValueError("unknown window '{}'".format(name))
+    return _WINDOWS[name](n)
+
+
+@lru_cache(maxsize=32)
+def _plan(bins: int, mode: str, window: str, beta: float, oversample: int):
+    """
+    Window, FFT size and impulse scale for a spectrum length; cached, as the sweeps of a capture share them
+    :return: (window, nfft, scale); the window array is read-only
+    """
+    if mode == "lowpass":
+        # right half of a symmetric window centred at DC, as the spectrum is mirrored around it
+        win = _window(window, 2 * bins - 1, beta)[bins - 1:]
+        nfft = 1 << int(math.ceil(math.log2(max(2 * (bins - 1) * oversample, 2))))
+        scale = nfft / (win[0] + 2 * win[1:].sum())
+    elif mode == "bandpass":
+        win = _window(window, bins, beta)
+        nfft = 1 << int(math.ceil(math.log2(max(bins * oversample, 2))))
+        scale = nfft / win.sum()
+    else:
+        raise ValueError("mode must be 'lowpass' or 'bandpass'")
+    win.setflags(write=False)
+    return win, nfft, scale
+
+
+def _lowpass_spectrum(freq, gamma, df):
+    """
+    Places the sweep on the harmonic grid k * df, from DC; the bins below the start of the sweep are
+    interpolated from a DC value extrapolated from the first two points (the reflection at DC is real)
+    """
+    k0 = int(round(freq[0] / df))
+    spec = np.zeros(gamma.shape[:-1] + (k0 + gamma.shape[-1],), dtype=np.complex128)
+    spec[..., k0:] = gamma
+    if k0:
+        dc = (gamma[..., 0] - (gamma[..., 1] - gamma[..., 0]) * (freq[0] / df)).real
+        t = np.arange(k0) / k0
+        spec[..., :k0] = dc[..., None] + (gamma[..., :1] - dc[..., None]) * t
+    return spec
+
+
+class TimeDomainResult:
+    """
+    Time-domain response of one sweep or a batch of them
+    distance is the one-way distance to the reflection of each sample, for the velocity factor used.
+    impulse has shape (..., samples): real in lowpass mode (its sign tells the kind of discontinuity),
+    magnitude in bandpass mode; a single reflection of coefficient g peaks at about g.
+    step is the integrated impulse (the reflection coefficient seen up to each distance), lowpass mode only.
+    """
+
+    def __init__(self, distance, time, impulse, step, mode):
+        self.distance = distance
+        self.time = time
+        self.impulse = impulse
+        self.step = step
+        self.mode = mode
+
+    def peaks(self, min_distance=0., max_distance=None):
+        """
+        Largest reflection of each response within a distance range, e.g. to trend a cable fault
+        :param min_distance:    start of the range in meters; skips the reflection at the connector
+        :param max_distance:    end of the range in meters; None up to the unambiguous range
+        :return: (distance, impulse) arrays of shape (...)
+        """
+        d = self.distance
+        i0 = int(np.searchsorted(d, min_distance, 'left'))
+        i1 = len(d) if max_distance is None else int(np.searchsorted(d, max_distance, 'right'))
+        if i1 <= i0:
+            raise ValueError("empty distance range")
+        h = self.impulse[..., i0:i1]
+        k = np.argmax(np.abs(h), axis=-1)
+        return d[i0:i1][k], np.take_along_axis(h, k[..., None], axis=-1)[..., 0]
+
+    def __repr__(self):
+        return "TimeDomainResult({}, {} responses, {} samples, {:.1f} m)".format(
+            self.mode, self.impulse[..., 0].size, len(self.distance), self.distance[-1])
+
+
+# ---------------------------------------------------------
+def time_domain(freq, gamma, vf=0.66, mode="lowpass", window="hann", beta=6., oversample=4) -> TimeDomainResult:
+    """
+    Transforms reflection coefficients over a uniform frequency grid to the time domain
+    Lowpass mode gives impulse and step responses; it is exact for sweeps starting at a multiple of the
+    step, and fills the band below the start otherwise. Bandpass mode works on any uniform sweep, but
+    gives the magnitude of the impulse only. Failed points (NaN) are taken as zero.
+    The unambiguous range is C0 * vf / (2 * step), the resolution about C0 * vf / (2 * span).
+    :param freq:        frequencies in hertz, uniform, shape (points,)
+    :param gamma:       reflection coefficients, shape (..., points): one sweep or many
+    :param vf:          velocity factor of the line
+    :param mode:        "lowpass" or "bandpass"
+    :param window:      "rect", "hann", "hamming", "blackman" or "kaiser"
+    :param beta:        kaiser window parameter
+    :param oversample:  zero padding factor of the transform
+    :return: TimeDomainResult
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    if len(freq) < 2:
+        raise ValueError("time_domain needs two points at least")
+    df = (freq[-1] - freq[0]) / (len(freq) - 1)
+    if df <= 0 or np.abs(np.diff(freq) - df).max() > 1e-3 * df + 1:
+        raise ValueError("time_domain needs a uniform increasing frequency grid")
+    gamma = np.nan_to_num(np.asarray(gamma, dtype=np.complex128))
+    if mode == "lowpass":
+        gamma = _lowpass_spectrum(freq, gamma, df)
+    win, nfft, scale = _plan(gamma.shape[-1], mode, window, float(beta), int(oversample))
+    if mode == "lowpass":
+        h = np.fft.irfft(gamma * win, n=nfft, axis=-1)
+        step = np.cumsum(h, axis=-1)
+        impulse = h * scale
+    else:
+        impulse = np.abs(np.fft.ifft(gamma * win, n=nfft, axis=-1)) * scale
+        step = None
+    time = np.arange(nfft) / (nfft * df)
+    return TimeDomainResult(time * (C0 * vf / 2), time, impulse, step, mode)
+
+
+def sweep_tdr(res: SweepResult, vf=0.66, mode="lowpass", window="hann", z0=50., **kwargs) -> TimeDomainResult:
+    """
+    Time-domain response of a linear sweep, e.g. Sark110.sweep(100000, 100000 * 1000, 1000) for lowpass mode
+    :param res:     SweepResult
+    :param vf:      velocity factor of the line
+    :param mode:    "lowpass" or "bandpass"
+    :param window:  window name
+    :param z0:      reference impedance
+    :return: TimeDomainResult
+    """
+    return time_domain(np.asarray(res.freq), z2gamma(res, z0=z0), vf, mode, window, **kwargs)
+
+
+def archive_tdr(reader, t0=None, t1=None, vf=0.66, mode="lowpass", window="hann", z0=50., **kwargs):
+    """
+    Time-domain responses of the sweeps of an archive within a time range, in one pass
+    :param reader:  ArchiveReader
+    :param t0:      start time; None from the first
+    :param t1:      end time; None to the last
+    :return: (times, TimeDomainResult) with responses of shape (sweeps, samples)
+    """
+    times, rs, xs = reader.time_range(t0, t1)
+    return times, time_domain(reader.freq, z2gamma(rs, xs, z0), vf, mode, window, **kwargs)
+
+
+def fault_trend(reader, min_distance=0., max_distance=None, t0=None, t1=None, chunk=256, **kwargs):
+    """
+    Distance and size of the largest reflection of every sweep of an archive, transformed in chunks of
+    sweeps so memory stays bounded on long captures
+    :param reader:          ArchiveReader
+    :param min_distance:    start of the range searched in meters
+    :param max_distance:    end of the range searched in meters; None up to the unambiguous range
+    :param t0:              start time; None from the first
+    :param t1:              end time; None to the last
+    :param chunk:           sweeps per transform
+    :param kwargs:          time_domain options (vf, mode, window, z0...)
+    :return: (times, distance, impulse) arrays of shape (sweeps,)
+    """
+    z0 = kwargs.pop("z0", 50.)
+    times, rs, xs = reader.time_range(t0, t1)
+    distance = np.empty(len(times))
+    impulse = np.empty(len(times))
+    for i in range(0, len(times), chunk):
+        td = time_domain(reader.freq, z2gamma(rs[i:i + chunk], xs[i:i + chunk], z0), **kwargs)
+        distance[i:i + chunk], impulse[i:i + chunk] = td.peaks(min_distance, max_distance)
+    return times, distance, impulse
@@ -0,0 +1,132 @@
+# ---------------------------------------------------------
+"""
+  This file is a part of the "SARK110 Antenna Vector Impedance Analyzer" software
+
+  MIT License
+
+  @author Copyright (c) 2020 Melchor Varela - EA4FRB
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+"""
+# ---------------------------------------------------------
+import numpy as np
+
+from sark110 import *
+
+FORMATS = ("RI", "MA", "DB")
+
+
+class TouchstoneWriter:
+    """
+    Writes a one-port Touchstone file (.s1p) chunk by chunk, e.g. straight from iter_sweep():
+
+        with TouchstoneWriter("antenna.s1p", "DB") as w:
+            for chunk in device.iter_sweep(1000000, 30000000, 10000):
+                w.write(chunk)
+
+    Points not measured (ok flag 0) are left out.
+    """
+
+    def __init__(self, path, fmt="RI", z0=50., comments=(), buffering=1 << 16):
+        """
+        :param path:        file name
+        :param fmt:         "RI" (real/imag), "MA" (magnitude/angle) or "DB" (dB/angle)
+        :param z0:          reference impedance
+        :param comments:    comment lines for the header
+        :param buffering:   write buffer size in bytes
+        """
+        fmt = fmt.upper()
+        if fmt not in FORMATS:
+            raise ValueError("Touchstone format must be one of {}".format(FORMATS))
+        self._fmt = fmt
+        self._z0 = z0
+        self._f = open(path, "w", buffering=buffering)
+        self.points = 0
+        for line in comments:
+            self._f.write("! {}\n".format(line))
+        self._f.write("# HZ S {} R {:g}\n".format(fmt, z0))
+
+    def write(self, chunk: SweepResult):
+        """
+        Appends the points of a sweep chunk
+        :param chunk:   SweepResult
+        """
+        freq = np.asarray(chunk.freq)
+        rs = np.asarray(chunk.rs, dtype=np.float64)
+        xs = np.asarray(chunk.xs, dtype=np.float64)
+        ok = np.asarray(chunk.ok, dtype=bool)
+        if not ok.all():
+            freq, rs, xs = freq[ok], rs[ok], xs[ok]
+        if not len(freq):
+            return
+        z = rs + 1j * xs
+        gamma = (z - self._z0) / (z + self._z0)
+        if self._fmt == "RI":
+            a, b = gamma.real, gamma.imag
+        else:
+            a = np.abs(gamma)
+            b = np.degrees(np.angle(gamma))
+            if self._fmt == "DB":
+                with np.errstate(divide='ignore'):
+                    a = 20 * np.log10(a)
+        np.savetxt(self._f, np.column_stack((freq, a, b)), fmt=("%d", "%.9g", "%.9g"))
+        self.points += len(freq)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_touchstone(path, res: SweepResult, fmt="RI", z0=50., comments=()) -> int:
+    """
+    Writes a whole sweep to a one-port Touchstone file
+    :return: number of points written
+    """
+    with TouchstoneWriter(path, fmt, z0, comments) as w:
+        w.write(res)
+        return w.points
+
+
+def to_network(res: SweepResult, z0=50., name=None):
+    """
+    Converts a sweep to a one-port skrf.Network. The reflection coefficient is computed in place in
+    the (points, 1, 1) array the Network uses, with no intermediate lists.
+    :param res:     SweepResult
+    :param z0:      reference impedance
+    :param name:    network name
+    :return: skrf.Network
+    """
+    import skrf as rf
+
+    s = np.empty((len(res), 1, 1), dtype=np.complex128)
+    gamma = s[:, 0, 0]
+    gamma.real = res.rs
+    gamma.imag = res.xs
+    den = gamma + z0
+    gamma -= z0
+    gamma /= den
+    freq = rf.Frequency.from_f(np.asarray(res.freq, dtype=np.float64), unit="hz")
+    return rf.Network(frequency=freq, s=s, z0=z0, name=name)
@@ -25,29 +25,11 @@
   SOFTWARE.
 """
 # ---------------------------------------------------------
-import math
 from sark110 import *
-import skrf as rf
+from sark110_touchstone import to_network
 from sys import argv
 
 
-def z2vswr(rs: float, xs: float, z0=50 + 0j) -> float:
-    gamma = math.sqrt((rs - z0.real) ** 2 + xs ** 2) / math.sqrt((rs + z0.real) ** 2 + xs ** 2)
-    if gamma > 0.980197824:
-        return 99.999
-    swr = (1 + gamma) / (1 - gamma)
-    return swr
-
-
-def z2mag(r: float, x: float) -> float:
-    return math.sqrt(r ** 2 + x ** 2)
-
-
-def z2gamma(rs: float, xs: float, z0=50 + 0j) -> complex:
-    z = complex(rs, xs)
-    return (z - z0) / (z + z0)
-
-
 if __name__ == '__main__':
     if len(argv) != 4:
         print("please provide arguments: start (Hz) stop (Hz) points")
@@ -70,17 +52,12 @@ if __name__ == '__main__':
     print(sark110.fw_protocol, sark110.fw_version)
     sark110.buzzer(1000, 800)
 
-    y = []
-    x = []
-    rs = [0]
-    xs = [0]
-    for i in range(points):
-        fr = int(fr_start + i * (fr_stop - fr_start) / (points - 1))
-        sark110.measure(fr, rs, xs)
-        x.append(fr / 1e9)  # Units in GHz
-        y.append(z2gamma(rs[0][0], xs[0][0]))
+    res = sark110.sweep(fr_start, fr_stop, points)
+    if res is None:
+        print("Sweep failed")
+        exit(-2)
 
-    ring_slot = rf.Network(frequency=x, s=y, z0=50)
+    ring_slot = to_network(res, z0=50)
     ring_slot.plot_s_smith(draw_labels=True)
 
     print("\nDone !")